@@ -1,7 +1,9 @@
 from flask import Flask
+from app import metrics
 from app.routes import api
 
 def create_app():
     app = Flask(__name__)
     app.register_blueprint(api)
+    metrics.init_app(app)
     return app
@@ -0,0 +1,91 @@
+import json
+import os
+import re
+import threading
+import time
+from app.constants import (
+    DATA_DIR,
+    JSON_FILE_PATH,
+    LEGACY_JSON_FILE_PATH,
+    SYNC_STATE_PATH,
+    REFRESH_RESULT_PATH,
+    STORE_PATH,
+    DEFAULT_ACCOUNT,
+    ACCOUNTS_DIR,
+    ACCOUNTS_FILE,
+    ACCOUNT_REQUEST_INTERVAL_SECONDS
+)
+from app.logger import logger
+from app.snapshot import migrate_snapshot
+
+ACCOUNT_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+_accounts = None
+_accounts_lock = threading.Lock()
+
+class Account:
+    """
+    A Strong account and its data partition. The default account keeps its
+    files directly in DATA_DIR, every other one in ACCOUNTS_DIR/<name>.
+    """
+
+    def __init__(self, name, username, password):
+        self.name = name
+        self.username = username
+        self.password = password
+        self.data_dir = DATA_DIR if name == DEFAULT_ACCOUNT else os.path.join(ACCOUNTS_DIR, name)
+        self.json_path = os.path.join(self.data_dir, os.path.basename(JSON_FILE_PATH))
+        self.sync_state_path = os.path.join(self.data_dir, os.path.basename(SYNC_STATE_PATH))
+        self.refresh_result_path = os.path.join(self.data_dir, os.path.basename(REFRESH_RESULT_PATH))
+        self.store_path = os.path.join(self.data_dir, os.path.basename(STORE_PATH))
+        os.makedirs(self.data_dir, exist_ok=True)
+        migrate_snapshot(os.path.join(self.data_dir, os.path.basename(LEGACY_JSON_FILE_PATH)), self.json_path)
+        self._next_request = 0.0
+        self._throttle_lock = threading.Lock()
+
+    @property
+    def has_credentials(self):
+        return bool(self.username and self.password)
+
+    def reserve_request(self):
+        """Books the next request slot of this account and returns the seconds to wait for it."""
+        with self._throttle_lock:
+            now = time.monotonic()
+            slot = max(self._next_request, now)
+            self._next_request = slot + ACCOUNT_REQUEST_INTERVAL_SECONDS
+            return slot - now
+
+    def throttle(self):
+        """Waits until this account may send its next request to Strong, so a refresh never floods it."""
+        time.sleep(self.reserve_request())
+
+def load_accounts():
+    """
+    Loads the default account from the username/password environment
+    variables and the other accounts from ACCOUNTS_FILE, a JSON object
+    mapping each account name to its username and password.
+    """
+    accounts = {DEFAULT_ACCOUNT: Account(DEFAULT_ACCOUNT, os.getenv("username"), os.getenv("password"))}
+    path = os.getenv("ACCOUNTS_FILE", ACCOUNTS_FILE)
+    if not os.path.exists(path):
+        return accounts
+    with open(path, "r") as file:
+        for name, credentials in json.load(file).items():
+            if not ACCOUNT_NAME_PATTERN.match(name) or name == DEFAULT_ACCOUNT:
+                logger.error(f"❌ Skipping account with invalid name {name!r}.")
+                continue
+            accounts[name] = Account(name, credentials.get("username"), credentials.get("password"))
+    logger.info(f"✅ Loaded {len(accounts)} accounts.")
+    return accounts
+
+def get_accounts():
+    """Returns every account by name, loading them on first use."""
+    global _accounts
+    with _accounts_lock:
+        if _accounts is None:
+            _accounts = load_accounts()
+        return _accounts
+
+def get_account(name=DEFAULT_ACCOUNT):
+    """Returns the account with that name, or None if there is none."""
+    return get_accounts().get(name)
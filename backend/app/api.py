@@ -1,37 +1,144 @@
+import aiohttp
+import asyncio
+import base64
+import io
 import os
 import requests
-from flask import Flask, jsonify
 from dotenv import load_dotenv
-from app.constants import STRONG_API_BASE_URL, JSON_FILE_PATH
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib.parse import parse_qs, urlparse
+from app.constants import (
+    STRONG_API_BASE_URL,
+    SYNC_PAGE_LIMIT,
+    SYNC_RESOURCES,
+    FULL_SYNC_INTERVAL_SECONDS,
+    REFRESH_POOL_SIZE,
+    HTTP_TIMEOUT,
+    HTTP_RETRIES,
+    HTTP_BACKOFF_FACTOR,
+    HTTP_POOL_SIZE,
+    TOKEN_TTL_SECONDS,
+    TOKEN_EXPIRY_MARGIN_SECONDS
+)
 from app.logger import logger
+from app.metrics import observe_upstream
+from app.accounts import get_account, get_accounts
+from app.cache import invalidate, snapshot_version
+from app.jsonstream import iter_embedded
+from app.snapshot import SnapshotWriter
+from app.utils import atomic_write, file_lock
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import threading
+import time
 
 load_dotenv()
 import json
 
-def get_auth():
-    """Gets the access token from the request cookies."""
+# Headers the Strong iOS app sends with every request
+STRONG_HEADERS = {
+    "Content-Type": "application/json",
+    "Accept": "application/json",
+    "accept-encoding": "gzip, deflate, br",
+    "x-client-platform": "ios",
+    "accept-language": "en-US,en;q=0.9",
+    "x-client-build": "8039",
+    "User-Agent": "Strong iOS",
+    "sentry-trace": "513627f9dbf64187a06723df9f5888c0-a684d4f373184e1e-0",
+}
+
+# Statuses worth retrying, the server may answer them once it recovers
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Pooled HTTP session shared by every sync of this process, and the access token of each account
+_session = None
+_session_lock = threading.Lock()
+_tokens = {}
+# One lock per account, so accounts log in in parallel while concurrent
+# callers of one account wait for its single login
+_token_locks = {}
+_token_locks_lock = threading.Lock()
+
+# Refresh currently running in this process for each account, shared by concurrent callers
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+def reset_after_fork():
+    """
+    Drops the state a forked worker inherits from the gunicorn master: the
+    session, whose pooled connections belong to the master, and the
+    refreshes and logins the master's scheduler may have been running. Their
+    threads do not exist in the child, so their futures would never resolve
+    and their locks never be released.
+    """
+    global _session, _session_lock, _tokens, _token_locks, _token_locks_lock, _inflight, _inflight_lock
+    _session = None
+    _session_lock = threading.Lock()
+    _tokens = {}
+    _token_locks = {}
+    _token_locks_lock = threading.Lock()
+    _inflight = {}
+    _inflight_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=reset_after_fork)
+
+def get_session():
+    """
+    Returns the session shared by every Strong API call of this process. It
+    keeps TLS connections alive between calls and retries connection errors
+    and 429/5xx responses with exponential backoff.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(
+                total=HTTP_RETRIES,
+                backoff_factor=HTTP_BACKOFF_FACTOR,
+                status_forcelist=RETRY_STATUSES,
+                allowed_methods=frozenset({"GET", "POST"}),
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+            _session = requests.Session()
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+            _session.headers.update(STRONG_HEADERS)
+        return _session
+
+def get_token_expiry(access_token):
+    """Reads the expiry of the access token from its JWT exp claim, assuming TOKEN_TTL_SECONDS otherwise."""
+    try:
+        payload = access_token.split(".")[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+        return float(claims["exp"])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return time.time() + TOKEN_TTL_SECONDS
+
+def login(account):
+    """Logs in to Strong with the credentials of an account."""
     try:
-        email = os.getenv("username")
-        password = os.getenv("password")
+        email = account.username
+        password = account.password
         # Send login request to Strong App API
         if not email or not password:
-            logger.error("❌ Missing username or password in environment variables.")
+            logger.error(f"❌ Missing username or password for account {account.name}.")
             return None
         
-        print("🔑 Requesting new access token...")
-        response = requests.post(
-            f"{STRONG_API_BASE_URL}/auth/login",
-            json={"usernameOrEmail": email, "password": password},
-            headers={
-                "Content-Type": "application/json",
-                "accept-encoding": "gzip, deflate, br",
-                "x-client-platform": "ios",
-                "accept-language": "en-US,en;q=0.9",
-                "x-client-build": "8039",
-                "User-Agent": "Strong iOS",
-                "sentry-trace": "513627f9dbf64187a06723df9f5888c0-a684d4f373184e1e-0",
-            },
-        )
+        logger.info(f"🔑 Requesting new access token for account {account.name}...")
+        account.throttle()
+        started = time.perf_counter()
+        try:
+            response = get_session().post(
+                f"{STRONG_API_BASE_URL}/auth/login",
+                json={"usernameOrEmail": email, "password": password},
+                timeout=HTTP_TIMEOUT,
+            )
+        except requests.RequestException:
+            observe_upstream("auth", started, "error")
+            raise
+        observe_upstream("auth", started, response.status_code)
 
         if response.status_code == 200:
             auth_data = response.json()
@@ -39,13 +146,15 @@ def get_auth():
                 logger.info("✅ Access token retrieved successfully.")
                 return  {
                     "access_token": auth_data["accessToken"],
-                    "user_id": auth_data['userId']
+                    "user_id": auth_data['userId'],
+                    "expires_at": get_token_expiry(auth_data["accessToken"]),
                 }
             else:
                 logger.error("❌ Access token missing in response.")
                 return None
         else:
-            return jsonify({"error": "Invalid credentials"}), 401
+            logger.error(f"❌ Login failed. Status: {response.status_code}")
+            return None
 
     except ValueError as e:
         logger.error(str(e))
@@ -53,49 +162,331 @@ def get_auth():
     except requests.RequestException as e:
         logger.error(f"❌ Request failed: {e}")
         return None
-    
-def get_data():
-    """Fetches all the data from Strong App API."""
-    auth_data = get_auth()
-    access_token = auth_data['access_token']
-    user_id= auth_data['user_id']
+
+def get_auth(account, force=False):
+    """
+    Returns the cached access token and user id of an account, logging in
+    again only when there is none, it is about to expire or force is set
+    (after a 401).
+    """
+    with _token_locks_lock:
+        lock = _token_locks.setdefault(account.name, threading.Lock())
+    with lock:
+        token = _tokens.get(account.name)
+        if force or not token or token["expires_at"] - TOKEN_EXPIRY_MARGIN_SECONDS < time.time():
+            token = _tokens[account.name] = login(account)
+        return token
+
+def get_continuation(links):
+    """Returns the continuation token of the next page from a page's links, or None on the last page."""
+    next_link = links.get("next")
+    if not next_link:
+        return None
+    query = parse_qs(urlparse(next_link["href"]).query)
+    return query.get("continuation", [None])[0]
+
+def load_sync_state(account):
+    """Loads the high-water marks of the last successful sync of an account."""
+    if not os.path.exists(account.sync_state_path) or not os.path.exists(account.json_path):
+        return {}
+    try:
+        with open(account.sync_state_path, "r") as file:
+            return json.load(file)
+    except (OSError, json.JSONDecodeError):
+        logger.warning("⚠️ Sync state is unreadable, falling back to a full sync.")
+        return {}
+
+class SyncProgress:
+    """Collects the stage timings and download counters of a sync. Subclasses can persist them in update()."""
+
+    def __init__(self):
+        self.stages = {}
+        self.pages = 0
+        self.items = 0
+        self.bytes_downloaded = 0
+
+    def update(self):
+        pass
+
+    @contextmanager
+    def stage(self, name):
+        started = time.monotonic()
+        self.stages[name] = {"started_at": datetime.now(timezone.utc).isoformat(), "seconds": None}
+        self.update()
+        try:
+            yield
+        finally:
+            self.stages[name]["seconds"] = round(time.monotonic() - started, 3)
+            self.update()
+
+    def add_page(self, size, items):
+        self.pages += 1
+        self.items += items
+        self.bytes_downloaded += size
+        self.update()
+
+class PageError(Exception):
+    """A page request answered with an error status."""
+
+    def __init__(self, status):
+        super().__init__(f"Failed to fetch data. Status: {status}")
+        self.status = status
+
+async def request_page(session, account, url, auth):
+    """
+    GETs a page and returns its body, retrying connection errors and 429/5xx
+    responses with exponential backoff. A rejected token is renewed once per
+    sync, shared by every concurrent request.
+    """
+    attempt = 0
+    while True:
+        token = auth["access_token"]
+        await asyncio.sleep(account.reserve_request())
+        started = time.perf_counter()
+        try:
+            async with session.get(url, headers={"Authorization": f"Bearer {token}"}) as response:
+                if response.status == 200:
+                    body = await response.read()
+                    observe_upstream("fetch", started, response.status)
+                    return body
+                observe_upstream("fetch", started, response.status)
+                if response.status == 401:
+                    # The cached token may have been revoked before its expiry, log in once more
+                    async with auth["lock"]:
+                        if auth["access_token"] == token:
+                            if auth["reauthenticated"]:
+                                raise PageError(401)
+                            logger.warning("🔑 Access token rejected, logging in again...")
+                            auth["reauthenticated"] = True
+                            renewed = await asyncio.to_thread(get_auth, account, True)
+                            if not renewed:
+                                raise PageError(401)
+                            auth["access_token"] = renewed["access_token"]
+                    continue
+                if response.status not in RETRY_STATUSES or attempt == HTTP_RETRIES:
+                    logger.error(f"❌ Failed to fetch data. Status: {response.status} - {await response.text()}")
+                    raise PageError(response.status)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            observe_upstream("fetch", started, "error")
+            if attempt == HTTP_RETRIES:
+                raise
+        await asyncio.sleep(HTTP_BACKOFF_FACTOR * 2 ** attempt)
+        attempt += 1
+
+async def fetch_resource(session, account, auth, resource, continuation, writer, progress):
+    """
+    Follows the continuation pages of one resource into the writer and
+    returns the token of the last page. The next page is requested as soon
+    as the links of the current one are read, so its download overlaps with
+    decoding and spooling the current page.
+    """
+    user_id = auth["user_id"]
+
+    def request(continuation):
+        url = f"{STRONG_API_BASE_URL}/api/users/{user_id}/?continuation={continuation}&limit={SYNC_PAGE_LIMIT}&include={resource}"
+        return asyncio.create_task(request_page(session, account, url, auth))
+
+    pending = request(continuation)
+    first_page = True
+    try:
+        while pending:
+            body = await pending
+            pending = None
+            items = 0
+            for key, value, text in iter_embedded(io.StringIO(body.decode("utf-8")), [resource], keys=("_links",), raw=True):
+                if key != "_links":
+                    # Items are spooled as the text they came in, never encoded again
+                    writer.add(key, value, text)
+                    items += 1
+                    continue
+                if first_page and resource == SYNC_RESOURCES[0]:
+                    writer.links = value
+                next_continuation = get_continuation(value)
+                # The last page's token is kept so the next sync resumes right after it
+                if next_continuation and next_continuation != continuation:
+                    continuation = next_continuation
+                    pending = request(continuation)
+                    # Let the request go out before decoding the rest of the page
+                    await asyncio.sleep(0)
+            first_page = False
+            progress.add_page(len(body), items)
+    finally:
+        if pending:
+            pending.cancel()
+    return continuation
+
+async def fetch_resources(account, auth, continuations, writer, progress):
+    """Fetches every synced resource concurrently and returns the continuation token each should resume from."""
+    timeout = aiohttp.ClientTimeout(sock_connect=HTTP_TIMEOUT[0], sock_read=HTTP_TIMEOUT[1])
+    connector = aiohttp.TCPConnector(limit=HTTP_POOL_SIZE)
+    auth = {**auth, "lock": asyncio.Lock(), "reauthenticated": False}
+    async with aiohttp.ClientSession(headers=STRONG_HEADERS, timeout=timeout, connector=connector) as session:
+        try:
+            async with asyncio.TaskGroup() as group:
+                tasks = [
+                    group.create_task(fetch_resource(
+                        session, account, auth, resource, continuations.get(resource, ""), writer, progress
+                    ))
+                    for resource in SYNC_RESOURCES
+                ]
+        except ExceptionGroup as e:
+            raise e.exceptions[0]
+    return {resource: task.result() for resource, task in zip(SYNC_RESOURCES, tasks)}
+
+def get_data(account, full=False, progress=None):
+    """
+    Syncs the data of an account from Strong App API into its data.json.
+    Only the resources the extractor reads are requested, each on its own
+    chain of continuation pages fetched concurrently, starting from the
+    high-water marks of the last sync unless a full sync is requested or
+    the last one is older than FULL_SYNC_INTERVAL_SECONDS. A resource
+    without a saved mark is fetched from its first page. Items are spooled
+    into a SnapshotWriter, which merges them into the existing snapshot by
+    id, and applied to the store in place of a rebuild. As only the last page of each resource is read again, items edited
+    or deleted in Strong further back are only updated by the next full
+    sync. Stage timings and download counters go to progress.
+    """
+    progress = progress or SyncProgress()
+    with progress.stage("auth"):
+        auth_data = get_auth(account)
     if not auth_data:
         logger.error("❌ No access token. Aborting data fetch.")
-        return
-    
-    url = f"https://back.strong.app/api/users/{user_id}/?continuation=&limit=300&include=template&include=log&include=measurement&include=widget&include=tag&include=folder&include=metric&include=measuredValue"
-
-    payload = ""
-    headers = {
-    'Content-Type': 'application/json',
-    'Accept': 'application/json',
-    'accept-encoding': 'gzip, deflate, br',
-    'x-client-platform': 'ios',
-    'accept-language': 'en-US,en;q=0.9',
-    'x-client-build': '8039',
-    'User-Agent': 'Strong iOS',
-    'sentry-trace': '513627f9dbf64187a06723df9f5888c0-a684d4f373184e1e-0',
-    'Authorization': 'Bearer ' + access_token
-    }
+        return {"status": "error", "message": "Failed to authenticate with Strong."}
+
+    state = {} if full else load_sync_state(account)
+    continuations = state.get("continuations", {})
+    if continuations and time.time() - state.get("full_synced_at", 0) >= FULL_SYNC_INTERVAL_SECONDS:
+        logger.info("🔄 Last full sync is too old, syncing everything again to pick up edits.")
+        continuations = {}
+    # A resource that fit in one page saved an empty token and fetches that page again
+    incremental = bool(continuations)
+    if incremental:
+        logger.info(f"🔄 Incremental sync from continuations {continuations}")
+    else:
+        logger.info("🔄 Full sync requested.")
+
+    writer = SnapshotWriter()
     try:
-        response = requests.get(url, headers=headers, data=payload)
-        if response.status_code == 200:
-            logger.info("✅ Data fetched successfully.")
-            try:
-                with open(JSON_FILE_PATH, "w") as file:
-                    json.dump(response.json(), file, indent=4)
-                logger.info(f"✅ Data saved at {JSON_FILE_PATH}")
-                return {"status": "success", "message": "Data fetched and saved successfully."}         
-            except Exception as e:
-                logger.error(f"❌ Failed to save data.json: {e}")
-                return {"status": "error", "message": f"Failed to save data: {e}"}
-        else:
-            logger.error(f"❌ Failed to fetch data. Status: {response.status_code} - {response.text}")
-            return {"status": "error", "message": f"Failed to fetch data. Status: {response.status_code}"}
+        with progress.stage("download"):
+            continuations = asyncio.run(fetch_resources(account, auth_data, continuations, writer, progress))
 
-    except requests.RequestException as e:
+        logger.info(f"✅ Data fetched successfully ({progress.pages} pages).")
+        with progress.stage("save"):
+            base_version = snapshot_version(account.json_path)
+            writer.write(account.json_path, merge=incremental)
+            full_synced_at = state["full_synced_at"] if incremental else time.time()
+            with atomic_write(account.sync_state_path) as file:
+                json.dump({"continuations": continuations, "full_synced_at": full_synced_at}, file, indent=4)
+        logger.info(f"✅ Data saved at {account.json_path}")
+        if incremental:
+            with progress.stage("store"):
+                ingest_sync(account, base_version, writer)
+        invalidate(account.name)
+        return {"status": "success", "message": f"Data fetched and saved successfully ({writer.count} items synced)."}
+    except PageError as e:
+        if e.status == 401:
+            return {"status": "error", "message": "Failed to authenticate with Strong."}
+        return {"status": "error", "message": str(e)}
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
         logger.error(f"❌ Request failed: {e}")
         return {"status": "error", "message": f"Request failed: {e}"}
+    except Exception as e:
+        logger.error(f"❌ Failed to save data.json: {e}")
+        return {"status": "error", "message": f"Failed to save data: {e}"}
+    finally:
+        writer.close()
+
+def ingest_sync(account, base_version, writer):
+    """
+    Applies the items of an incremental sync to the store of an account.
+    When the store is behind the snapshot or the update fails, the store is
+    left as it is and the next extraction rebuilds it from the snapshot.
+    """
+    # The extractor imports this module
+    from app.extractor import ingest_synced_items
+
+    try:
+        ingest_synced_items(account, base_version, writer.items())
+    except Exception as e:
+        logger.warning(f"⚠️ Failed to update the store of account {account.name} in place: {e}")
+
+def refresh_across_processes(account, full, progress=None):
+    """
+    Runs get_data while holding the account's snapshot lock. A process that
+    finds the lock taken waits for the running refresh and returns its
+    result instead of downloading the data again. Results are stamped with
+    when they were saved, so a waiter never takes the result of an earlier
+    run for that of a refresh which died before saving its own.
+    """
+    waiting_since = time.time()
+    with file_lock(account.json_path, blocking=False) as acquired:
+        if acquired:
+            result = get_data(account, full, progress)
+            with atomic_write(account.refresh_result_path) as file:
+                json.dump({"finished_at": time.time(), "result": result}, file)
+            return result
+
+    logger.info(f"⏳ Another process is refreshing account {account.name}, waiting for its result...")
+    with file_lock(account.json_path):
+        pass
+    try:
+        with open(account.refresh_result_path, "r") as file:
+            saved = json.load(file)
+        if saved["finished_at"] >= waiting_since:
+            return saved["result"]
+    except (OSError, json.JSONDecodeError, KeyError, TypeError):
+        pass
+    return {"status": "error", "message": "Concurrent refresh finished without a result."}
+
+def refresh(full=False, progress=None, account=None):
+    """
+    Single-flight refresh of an account (the default one unless given):
+    concurrent calls in this process share one upstream fetch, and calls
+    from other workers wait for it through the snapshot lock. Everything
+    that refreshes a data.json should go through here.
+    """
+    account = account or get_account()
+    with _inflight_lock:
+        future = _inflight.get(account.name)
+        leader = future is None
+        if leader:
+            future = _inflight[account.name] = Future()
+    if not leader:
+        logger.info("⏳ Joining the refresh already in progress...")
+        return future.result()
+
+    try:
+        result = refresh_across_processes(account, full, progress)
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            del _inflight[account.name]
+
+def refresh_all(full=False):
+    """
+    Refreshes every account with credentials, REFRESH_POOL_SIZE at a time,
+    and returns the result of each by account name.
+    """
+    def refresh_account(account):
+        try:
+            return refresh(full, account=account)
+        except Exception as e:
+            logger.error(f"❌ Refresh of account {account.name} failed: {e}")
+            return {"status": "error", "message": str(e)}
+
+    accounts = [account for account in get_accounts().values() if account.has_credentials]
+    logger.info(f"🔄 Refreshing {len(accounts)} accounts...")
+    with ThreadPoolExecutor(max_workers=REFRESH_POOL_SIZE, thread_name_prefix="refresh-all") as executor:
+        results = executor.map(refresh_account, accounts)
+        results = {account.name: result for account, result in zip(accounts, results)}
+    failed = [name for name, result in results.items() if result.get("status") != "success"]
+    if failed:
+        logger.error(f"❌ Refresh failed for {len(failed)} accounts: {', '.join(failed)}")
+    return results
 
 if __name__ == "__main__":
-    get_data()
\ No newline at end of file
+    refresh_all()
\ No newline at end of file
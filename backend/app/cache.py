@@ -0,0 +1,80 @@
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from app.constants import JSON_FILE_PATH, CACHE_MAX_ENTRIES
+from app.logger import logger
+
+# Derived data of this worker, keyed by the version of data.json it was built
+# from, in least recently used order
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+# One lock per cached name, so a build may depend on another cached result
+_locks = {}
+
+def snapshot_version(path=JSON_FILE_PATH):
+    """Returns a version string for the snapshot (a path or an open file descriptor), built from its mtime and size."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+def snapshot_last_modified(path=JSON_FILE_PATH):
+    """Returns when the snapshot was last written, or None if there is none."""
+    try:
+        return datetime.fromtimestamp(os.path.getmtime(path), timezone.utc)
+    except FileNotFoundError:
+        return None
+
+def get_entry(name, version):
+    """Returns the cached (version, result) of name if it was built from version, marking it as recently used."""
+    with _cache_lock:
+        entry = _cache.get(name)
+        if entry and version is not None and entry[0] == version:
+            _cache.move_to_end(name)
+            return entry
+    return None
+
+def get_cached(name, build, path=JSON_FILE_PATH):
+    """
+    Returns the cached result of build() for the current snapshot at path,
+    running it only when that data.json has changed since the last call.
+    Only the CACHE_MAX_ENTRIES most recently used names are kept.
+    """
+    version = snapshot_version(path)
+    entry = get_entry(name, version)
+    if entry:
+        return entry[1]
+
+    with _locks.setdefault(name, threading.Lock()):
+        # Another thread may have rebuilt it while we were waiting
+        version = snapshot_version(path)
+        entry = get_entry(name, version)
+        if entry:
+            return entry[1]
+
+        logger.info(f"🔄 Snapshot changed, rebuilding {name}...")
+        result = build()
+        # data.json is fetched on demand when missing, so version it afterwards
+        if version is None:
+            version = snapshot_version(path)
+        with _cache_lock:
+            _cache[name] = (version, result)
+            _cache.move_to_end(name)
+            while len(_cache) > CACHE_MAX_ENTRIES:
+                evicted, _ = _cache.popitem(last=False)
+                # Keep the lock while a build holds it, the next build of that name reuses it
+                lock = _locks.get(evicted)
+                if lock and not lock.locked():
+                    _locks.pop(evicted, None)
+        return result
+
+def invalidate(account=None):
+    """Drops the cached results of an account, named "<account>:...", or every cached result of this worker."""
+    with _cache_lock:
+        if account is None:
+            _cache.clear()
+            return
+        for name in [name for name in _cache if name.startswith(f"{account}:")]:
+            del _cache[name]
@@ -3,15 +3,68 @@ import os
 # Base directories
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))  # Gets current dir (backend/app/)
 DATA_DIR = os.path.join(BASE_DIR, "data")  # Path to backend/app/data/
-JSON_FILE_PATH = os.path.join(DATA_DIR, "data.json")  # Full path to JSON file
+JSON_FILE_PATH = os.path.join(DATA_DIR, "data.json.gz")  # Full path to the gzip-compressed JSON snapshot
+LEGACY_JSON_FILE_PATH = os.path.join(DATA_DIR, "data.json")  # Uncompressed snapshot of older versions, migrated on startup
+SNAPSHOT_COMPRESSION_LEVEL = 6  # gzip level, most of the size gain of 9 at a fraction of the CPU
+SYNC_STATE_PATH = os.path.join(DATA_DIR, "sync_state.json")  # High-water mark of the last sync
+REFRESH_RESULT_PATH = os.path.join(DATA_DIR, "refresh_result.json")  # Result shared with workers waiting on a refresh
+JOBS_DIR = os.path.join(DATA_DIR, "jobs")  # Status files of background refresh jobs
+JOB_RETENTION_SECONDS = 24 * 60 * 60
 
-# Exercise CSV Paths
-BENCH_PRESS_PATH = os.path.join(DATA_DIR, "Bench Press (Barbell).csv")
-DEADLIFT_PATH = os.path.join(DATA_DIR, "Deadlift (Barbell).csv")
-SQUAT_PATH = os.path.join(DATA_DIR, "Squat (Barbell).csv")
-OVERHEAD_PRESS_PATH = os.path.join(DATA_DIR, "Overhead Press (Barbell).csv")
-WEEKLY_VOLUME_PATH = os.path.join(DATA_DIR, "Weekly_volume.csv")
-BODYWEIGHT_PATH = os.path.join(DATA_DIR, "Bodyweight.csv")
+STORE_PATH = os.path.join(DATA_DIR, "strong.db")  # SQLite store built from data.json
+STORE_MMAP_BYTES = 256 * 1024 * 1024  # Store size read through a memory map shared by the workers
+CACHE_MAX_ENTRIES = 256  # Results cached per worker, such as the series of each charted exercise
+CACHE_WARM_INTERVAL_SECONDS = 5  # How often workers check for new snapshots to warm their cache with
+CACHE_WARM_ACCOUNTS = 16  # Accounts each worker keeps warm, its most recently served, within half of CACHE_MAX_ENTRIES
+
+# Scheduled refresh: one process or node runs it, elected through a lease file in DATA_DIR
+SCHEDULER_LEASE_PATH = os.path.join(DATA_DIR, "scheduler_lease.json")
+SCHEDULER_LEASE_SECONDS = 60 * 60
+SCHEDULER_JITTER_SECONDS = 5 * 60
+
+# Accounts: the default one uses the files above, the others get a partition in ACCOUNTS_DIR
+DEFAULT_ACCOUNT = "default"
+ACCOUNTS_DIR = os.path.join(DATA_DIR, "accounts")
+ACCOUNTS_FILE = os.path.join(os.path.dirname(BASE_DIR), "accounts.json")  # Credentials of the other accounts
+REFRESH_POOL_SIZE = 8  # Accounts refreshed in parallel by the scheduled job
+ACCOUNT_REQUEST_INTERVAL_SECONDS = 0.5  # Minimum spacing of one account's requests to Strong
+
+# Strong stores weights in kg, the dashboard shows lbs
+LBS_PER_KG = 2.20462
+
+# Exercises charted on the dashboard (measurement ids from the Strong API)
+BENCH_PRESS_ID = "ca9ee259-a69f-4839-bbf9-46ba8cf0d7d6"
+DEADLIFT_ID = "b748103d-3014-4cae-a349-cec433528c3a"
+SQUAT_ID = "b2f5a2de-c684-4e94-a6e5-581e0695fcac"
+OVERHEAD_PRESS_ID = "4d563338-f2ed-430d-ae12-ec45482edf20"
+TRACKED_EXERCISES = {
+    "bench_press": BENCH_PRESS_ID,
+    "deadlift": DEADLIFT_ID,
+    "squat": SQUAT_ID,
+    "overhead_press": OVERHEAD_PRESS_ID,
+}
 
 # API Base URL
 STRONG_API_BASE_URL = "https://back.strong.app"
+
+# HTTP client settings
+HTTP_TIMEOUT = (10, 60)  # Connect and read timeouts in seconds
+HTTP_RETRIES = 3
+HTTP_BACKOFF_FACTOR = 1  # Retries wait 1s, 2s, 4s...
+HTTP_POOL_SIZE = REFRESH_POOL_SIZE  # One connection per account refreshed in parallel
+TOKEN_TTL_SECONDS = 60 * 60  # Assumed lifetime when the token has no exp claim
+TOKEN_EXPIRY_MARGIN_SECONDS = 60
+
+# Sync settings
+SYNC_PAGE_LIMIT = 300
+# Only the resources the extractor reads, each fetched on its own chain of pages
+SYNC_RESOURCES = ["log", "measurement", "measuredValue"]
+# Incremental syncs only read the last page of each resource, so edits to older items are
+# picked up by a full sync, run instead of an incremental one once the last is this old
+FULL_SYNC_INTERVAL_SECONDS = 7 * 24 * 60 * 60
+
+# Rep counts whose heaviest weight is tracked as a record (1RM, 3RM, 5RM)
+REP_MAX_REPS = (1, 3, 5)
+
+# Rows of an export encoded per chunk of the streamed response
+EXPORT_CHUNK_ROWS = 1000
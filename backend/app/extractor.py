@@ -1,186 +1,180 @@
-from app.constants import JSON_FILE_PATH, DATA_DIR
-from app.api import get_data
-from collections import defaultdict
+from app.api import refresh
+from app.cache import snapshot_version
+from app.store import build_store, get_store_version, update_store
+from app.utils import file_lock
+from app.jsonstream import iter_embedded
 from app.logger import logger
-
-import pandas as pd
+from app.snapshot import read_snapshot
+from datetime import datetime, timezone
+import gzip
 import json
-import csv
 import os
 
-def load_json_data_local():
+# Resources of the snapshot the extractor reads
+EXTRACTED_RESOURCES = {"log", "measurement", "measuredValue"}
+
+def ensure_snapshot(account):
+    """Fetches the data.json of an account from Strong when it is missing or empty."""
     # Check if the file exists
-    if not os.path.exists(JSON_FILE_PATH):
-        logger.info("data.json does not exist. Fetching data...")
-        result = get_data()
+    if not os.path.exists(account.json_path):
+        logger.info(f"data.json of account {account.name} does not exist. Fetching data...")
+        result = refresh(account=account)
         if result.get("status") != "success":
             raise Exception("Failed to fetch data. Cannot proceed.")
     
     # Check if the file is empty
-    if os.path.getsize(JSON_FILE_PATH) == 0:
-        logger.warning("data.json is empty. Fetching data...")
-        result = get_data()
+    if os.path.getsize(account.json_path) == 0:
+        logger.warning(f"data.json of account {account.name} is empty. Fetching data...")
+        result = refresh(account=account)
         if result.get("status") != "success":
             raise Exception("Failed to fetch data. Cannot proceed.")
 
-    # Load JSON data
-    logger.info(f"Loading data from: {JSON_FILE_PATH}")
+def load_json_data_local(file):
+    """
+    Streams the (resource, item) pairs the extractor needs from a snapshot
+    opened in binary mode, one item at a time, decompressing it on the fly.
+    """
+    logger.info(f"Loading data from: {file.name}")
     try:
-        with open(JSON_FILE_PATH, "r") as file:
-            data = json.load(file)
-    except json.JSONDecodeError:
+        yield from iter_embedded(read_snapshot(file), EXTRACTED_RESOURCES)
+    except (json.JSONDecodeError, EOFError, gzip.BadGzipFile, UnicodeDecodeError):
         logger.error("Failed to parse data.json. The file might be corrupted.")
         raise Exception("Failed to parse data.json. The file might be corrupted.")
 
-    return data
-
-def extract_data(data):
-    logger.info("Extracting data...")
-    workout_logs = data['_embedded']['log']
-    exercises = data['_embedded']['measurement']
-    weight = data['_embedded']['measuredValue']
-    tags = data['_embedded']['tag']
-    logger.info(f"length of workout_logs: {len(workout_logs)}")
-    logger.info(f"length of exercises: {len(exercises)}")
-    logger.info(f"length of weight: {len(weight)}")
-    return workout_logs, exercises, weight
+def extract_exercise(exercise):
+    tag = None
+    if "tag" in exercise["_links"]:
+        tag = exercise["_links"]["tag"][0]["href"].split("/")[-1]
+    if "en" not in exercise["name"] and "custom" in exercise["name"]:
+        name = exercise["name"]["custom"]
+    else:
+        name = exercise["name"]["en"]
+    return exercise["id"], name, tag
 
 def extract_exercises(exercises):
     exercise_dict = {}
     for exercise in exercises:
-        tag = None
-        if "tag" in exercise["_links"]:
-            tag = exercise["_links"]["tag"][0]["href"].split("/")[-1]
-        if "en" not in exercise["name"] and "custom" in exercise["name"]:
-            name = exercise["name"]["custom"]
-        else:
-            name = exercise["name"]["en"]
-        id = exercise["id"]
+        id, name, tag = extract_exercise(exercise)
         exercise_dict[id] = {"tag": tag, "name": name}
-    # save to json file
-    # with open("exercises.json", "w") as file:
-    #     json.dump(exercise_dict, file, indent=4)
     return exercise_dict
 
-def extract_workout_logs(exercise_id, exercise_dict, logs):
-    exercise_data = []
-    # Goal is to extract all data for a specific exercise into csv file
-    for workout in logs:
-        if workout['logType'] == "WORKOUT":
-            if "isHidden" in workout and workout["isHidden"]:
-                continue
-            timestamp = workout['startDate']
-            for sets in workout['_embedded']['cellSetGroup']:
-                if "measurement" not in sets['_links']:
-                    continue
-                exercise_id_local = sets['_links']['measurement']['href'].split("/")[-1]
-                if exercise_id_local == exercise_id:
-                    for set in sets['cellSets']:
-                        weight, reps, rpe = None, None, None
-                        for cell in set['cells']:
-                            if "isHidden" in cell and cell["isHidden"]:
-                                continue
-                            if cell['cellType'] == "BARBELL_WEIGHT":
-                                weight = float(cell['value'])
-                                # convert weight to Lbs
-                                weight *= 2.20462
-                            elif cell['cellType'] == "REPS":
-                                reps = cell['value']
-                            elif cell['cellType'] == "RPE":
-                                if 'value' in cell:
-                                    rpe = cell['value']
-                        # Ensure both weight and reps exist before storing
-                        if weight is not None and reps is not None:
-                            exercise_data.append([timestamp, weight, reps, rpe])
-    
-    exercise_data.sort(key=lambda x: x[0])
-    
-    # Save to CSV file
-    file_name = os.path.join(DATA_DIR, f"{(exercise_dict[exercise_id]['name']).strip()}.csv")
-    with open(file_name, "w", newline="") as file:
-        writer = csv.writer(file)
-        writer.writerow(["timestamp", "weight", "reps", "rpe"])  # CSV Headers
-        writer.writerows(exercise_data)  # Write extracted workout data
-            
-    return exercise_data
+# Set cell types and the sets column each of them fills
+CELL_COLUMNS = {"BARBELL_WEIGHT": "weight", "REPS": "reps", "RPE": "rpe"}
 
-def extract_bodyweight_logs(bodyweight):
-    logger.info("Extracting bodyweight logs...")
-    bodyweight_data = []
-    for weight in bodyweight:
-        if "isHidden" in weight and weight["isHidden"]:
-            continue
-        if weight['measurementTypeValue'] == "WEIGHT":
-            timestamp = weight['startDate']
-            value = weight['value']
-            # convert weight to Lbs
-            value *= 2.20462
-            bodyweight_data.append([timestamp, value])
+def epoch_time(timestamp):
+    """Parses a single ISO timestamp into epoch seconds, reading it as UTC when it has no offset."""
+    parsed = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
 
-    file_path = os.path.join(DATA_DIR, "Bodyweight.csv")
-    with open(file_path, "w", newline="") as file:
-        writer = csv.writer(file)
-        writer.writerow(["timestamp", "weight"])  # CSV Headers
-        writer.writerows(bodyweight_data)
+def epoch_week(time):
+    """Returns the week of an epoch time, as the epoch day of the Sunday (UTC) closing it like pandas' weekly resample."""
+    days = time // 86400
+    # 1970-01-01 was a Thursday, weekday 3
+    return days + (6 - (days + 3) % 7)
+
+def to_number(value):
+    """Parses a cell value into a float, or None when it is missing or malformed."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
 
-def calculate_weekly_volume(exercise_dict, logs):
+def flatten_sets(workout, workout_code, time, week, exercises, rows):
     """
-    Calculates weekly volume for muscle groups
+    Appends one sets row per set of a workout log to rows, with the exercise
+    UUID interned to its code and the time and week of the workout. Every set
+    is kept, including warm-up and hidden ones, so the store can serve both
+    the per-exercise series and the weekly volume.
     """
-    all_volumes = []
-    for workout in logs:
-        if workout['logType'] == "WORKOUT":
-            if "isHidden" in workout and workout["isHidden"]:
-                continue
-            timestamp = workout['startDate']
-            volume = defaultdict(int)
-            for sets in workout['_embedded']['cellSetGroup']:
-                if "measurement" not in sets['_links']:
-                    continue
-                exercise_id_local = sets['_links']['measurement']['href'].split("/")[-1]
-                tag = exercise_dict[exercise_id_local]["tag"]
-                
-                if not tag:
-                    continue
-                
-                for set in sets['cellSets']:
-                    if set.get("cellSetTag") == "WARM_UP" or set.get("isHidden", False):
-                        continue
-                    volume[tag] += 1
-
-            if volume:
-                all_volumes.append({'timestamp': timestamp, **volume})        
-    
-      # Convert to DataFrame
-    df = pd.DataFrame(all_volumes)
-
-    # Convert 'timestamp' to datetime
-    df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
-
-    # Drop rows with invalid timestamps
-    df = df.dropna(subset=['timestamp'])
-
-    # Sort by timestamp
-    df = df.sort_values(by='timestamp')
-
-    # Set 'timestamp' as index
-    df.set_index('timestamp', inplace=True)
-
-    # Resample data by week and sum the sets for each muscle group
-    weekly_volume_df = df.resample('W').sum().fillna(0)
-    
-    output_path = os.path.join(DATA_DIR, 'Weekly_volume.csv')
-    weekly_volume_df.to_csv(output_path)  
-    
+    for sets in workout['_embedded']['cellSetGroup']:
+        if "measurement" not in sets['_links']:
+            continue
+        exercise_id = sets['_links']['measurement']['href'].split("/")[-1]
+        exercise = exercises.code(exercise_id)
+        for set in sets['cellSets']:
+            values = {}
+            for cell in set['cells']:
+                column = CELL_COLUMNS.get(cell['cellType'])
+                if column and not ("isHidden" in cell and cell["isHidden"]):
+                    values[column] = cell.get('value')
+            rows.append((
+                workout_code, exercise, time, week,
+                to_number(values.get("weight")), to_number(values.get("reps")), to_number(values.get("rpe")),
+                set.get("cellSetTag") == "WARM_UP", set.get("isHidden", False),
+            ))
+
+def extract_body_measurement(measured_value):
+    if "isHidden" in measured_value and measured_value["isHidden"]:
+        return None
+    return [
+        measured_value['id'], measured_value['measurementTypeValue'], measured_value['startDate'],
+        epoch_time(measured_value['startDate']), measured_value['value'],
+    ]
+
+def extract_rows(items, exercise_ids=(), tag_ids=(), workout_code=0):
+    """
+    Turns the streamed (resource, item) pairs into (table, row) pairs for the
+    store. Workouts are numbered in order from workout_code and exercise and
+    tag UUIDs interned to codes, after those of a store being updated.
+    """
+    from app.model import Interner
 
-def main():
-    data_local = load_json_data_local()
-    workout_logs, exercises, bodyweight = extract_data(data_local)
-    exercise_dict  = extract_exercises(exercises)
-    extract_workout_logs('ca9ee259-a69f-4839-bbf9-46ba8cf0d7d6', exercise_dict, workout_logs)
-    extract_workout_logs('b748103d-3014-4cae-a349-cec433528c3a', exercise_dict, workout_logs)
-    extract_workout_logs('b2f5a2de-c684-4e94-a6e5-581e0695fcac', exercise_dict, workout_logs)
-    extract_workout_logs('4d563338-f2ed-430d-ae12-ec45482edf20', exercise_dict, workout_logs)
-    calculate_weekly_volume(exercise_dict, workout_logs)
-    extract_bodyweight_logs(bodyweight)
-    
\ No newline at end of file
+    exercises, tags = Interner(exercise_ids), Interner(tag_ids)
+    sets = []
+    for resource, item in items:
+        if resource == "log":
+            if item['logType'] != "WORKOUT" or item.get("isHidden"):
+                continue
+            time = epoch_time(item['startDate'])
+            week = epoch_week(time)
+            flatten_sets(item, workout_code, time, week, exercises, sets)
+            yield "workouts", (workout_code, item['id'], item['startDate'], time, week)
+            for row in sets:
+                yield "sets", row
+            workout_code, sets = workout_code + 1, []
+        elif resource == "measurement":
+            id, name, tag = extract_exercise(item)
+            yield "exercises", (exercises.code(id), name, None if tag is None else tags.code(tag))
+        elif resource == "measuredValue":
+            row = extract_body_measurement(item)
+            if row:
+                yield "body_measurements", row
+    for row in exercises.rows():
+        yield "exercise_codes", row
+    for row in tags.rows():
+        yield "tag_codes", row
+
+def main(account):
+    """Rebuilds the SQLite store of an account from its data.json when the snapshot has changed since the last build."""
+    ensure_snapshot(account)
+    # Snapshots are replaced atomically, so the open file keeps the version read from it
+    with open(account.json_path, "rb") as file:
+        version = snapshot_version(file.fileno())
+        if get_store_version(account.store_path) == version:
+            return
+        # Only one worker builds, the others wait and find the store up to date
+        with file_lock(account.store_path):
+            if get_store_version(account.store_path) == version:
+                return
+            build_store(version, extract_rows(load_json_data_local(file)), account.store_path)
+
+def ingest_synced_items(account, base_version, items):
+    """
+    Applies the items of an incremental sync to the store of an account in
+    place of a rebuild, as long as the store was built from the snapshot
+    they were merged into (base_version). Returns whether it did.
+    """
+    items = [(resource, item) for resource, item in items if resource in EXTRACTED_RESOURCES]
+    version = snapshot_version(account.json_path)
+    with file_lock(account.store_path):
+        if get_store_version(account.store_path) != base_version:
+            return False
+        with update_store(version, account.store_path) as update:
+            update.remove(
+                (item["id"] for resource, item in items if resource == "log"),
+                (item["id"] for resource, item in items if resource == "measuredValue"),
+            )
+            update.insert(extract_rows(items, *update.codes()))
+    return True
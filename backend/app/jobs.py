@@ -0,0 +1,113 @@
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from app.api import SyncProgress, refresh
+from app.constants import JOBS_DIR, JOB_RETENTION_SECONDS
+from app.extractor import main
+from app.logger import logger
+from app.utils import atomic_write
+
+# Refreshes run one at a time on this worker's background thread
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="refresh")
+_active_jobs = {}
+_active_lock = threading.Lock()
+
+JOB_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+class RefreshJob(SyncProgress):
+    """
+    A background refresh whose progress is saved to JOBS_DIR, so any
+    gunicorn worker can report it, not only the one running it.
+    """
+
+    def __init__(self, full, account):
+        super().__init__()
+        self.id = uuid.uuid4().hex
+        self.full = full
+        self.account = account
+        self.status = "queued"
+        self.created_at = datetime.now(timezone.utc).isoformat()
+        self.finished_at = None
+        self.result = None
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "account": self.account.name,
+            "status": self.status,
+            "full": self.full,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "pages": self.pages,
+            "items": self.items,
+            "bytes_downloaded": self.bytes_downloaded,
+            "stages": self.stages,
+            "result": self.result,
+        }
+
+    def update(self):
+        with atomic_write(os.path.join(JOBS_DIR, f"{self.id}.json")) as file:
+            json.dump(self.to_dict(), file)
+
+    def run(self):
+        self.status = "running"
+        self.update()
+        try:
+            self.result = refresh(self.full, self, self.account)
+            if self.result.get("status") == "success":
+                # The store is rebuilt right away, not by the next request
+                with self.stage("build"):
+                    main(self.account)
+            self.status = "succeeded" if self.result.get("status") == "success" else "failed"
+        except Exception as e:
+            logger.error(f"❌ Refresh job {self.id} failed: {e}")
+            self.result = {"status": "error", "message": str(e)}
+            self.status = "failed"
+        finally:
+            self.finished_at = datetime.now(timezone.utc).isoformat()
+            self.update()
+            with _active_lock:
+                del _active_jobs[self.account.name]
+
+def remove_old_jobs():
+    """Deletes the status files of jobs older than JOB_RETENTION_SECONDS."""
+    cutoff = time.time() - JOB_RETENTION_SECONDS
+    for name in os.listdir(JOBS_DIR):
+        path = os.path.join(JOBS_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def submit_refresh(full, account):
+    """
+    Queues a refresh of an account on the background thread and returns its
+    job. While a job of that account is queued or running on this worker,
+    the same job is returned.
+    """
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    with _active_lock:
+        if account.name in _active_jobs:
+            return _active_jobs[account.name]
+        remove_old_jobs()
+        job = _active_jobs[account.name] = RefreshJob(full, account)
+    job.update()
+    _executor.submit(job.run)
+    logger.info(f"🔄 Queued refresh job {job.id} for account {account.name}")
+    return job
+
+def get_job(job_id):
+    """Returns the saved status of a job, or None if it is unknown."""
+    if not JOB_ID_PATTERN.match(job_id):
+        return None
+    try:
+        with open(os.path.join(JOBS_DIR, f"{job_id}.json"), "r") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
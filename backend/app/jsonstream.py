@@ -0,0 +1,132 @@
+import json
+import re
+
+CHUNK_SIZE = 64 * 1024
+WHITESPACE = " \t\n\r"
+SCALAR_END = re.compile(r"[\s,\]}]")
+
+class JSONStreamReader:
+    """
+    Reads a JSON document from a text stream one value at a time, keeping
+    only the value being decoded (plus one chunk) in memory.
+    """
+
+    def __init__(self, file, chunk_size=CHUNK_SIZE):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def fill(self):
+        """Reads the next chunk into the buffer, dropping what was already consumed."""
+        if self.eof:
+            return False
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Returns the next non-whitespace character without consuming it."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                raise json.JSONDecodeError("Unexpected end of stream", self.buffer, self.pos)
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise json.JSONDecodeError(f"Expected {char!r}", self.buffer, self.pos)
+        self.pos += 1
+
+    def decode_value(self, raw=False):
+        """
+        Decodes the next complete value, reading more chunks until it fits in
+        the buffer. With raw=True, returns it with its JSON text as (value, text).
+        """
+        if self.peek() not in '{["':
+            # A number or literal is only complete once the character after it is buffered
+            while not SCALAR_END.search(self.buffer, self.pos) and self.fill():
+                pass
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            text = self.buffer[self.pos:end] if raw else None
+            self.pos = end
+            return (value, text) if raw else value
+
+    def iter_object(self):
+        """Yields the keys of the next object; the caller must consume each key's value."""
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.decode_value()
+            self.expect(":")
+            yield key
+            if self.peek() == ",":
+                self.pos += 1
+                continue
+            self.expect("}")
+            return
+
+    def iter_array(self, raw=False):
+        """Yields the items of the next array, decoding one item at a time."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.decode_value(raw)
+            if self.peek() == ",":
+                self.pos += 1
+                continue
+            self.expect("]")
+            return
+
+    def skip_value(self):
+        """Consumes the next value without holding whole arrays or objects in memory."""
+        char = self.peek()
+        if char == "[":
+            for _ in self.iter_array():
+                pass
+        elif char == "{":
+            for _ in self.iter_object():
+                self.skip_value()
+        else:
+            self.decode_value()
+
+def iter_embedded(file, resources=None, keys=(), raw=False):
+    """
+    Streams a Strong API document, yielding (resource, item) for each item of
+    the requested `_embedded` arrays (all of them when resources is None) and
+    (key, value) for the requested top-level keys such as `_links`.
+    Everything else is skipped. With raw=True, triples carrying the JSON text
+    of each value are yielded instead, so it can be copied without re-encoding.
+    """
+    reader = JSONStreamReader(file)
+    for key in reader.iter_object():
+        if key == "_embedded" and reader.peek() == "{":
+            for resource in reader.iter_object():
+                if (resources is None or resource in resources) and reader.peek() == "[":
+                    for item in reader.iter_array(raw):
+                        yield (resource, *item) if raw else (resource, item)
+                else:
+                    reader.skip_value()
+        elif key in keys:
+            value = reader.decode_value(raw)
+            yield (key, *value) if raw else (key, value)
+        else:
+            reader.skip_value()
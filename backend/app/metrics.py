@@ -0,0 +1,111 @@
+import os
+import time
+from flask import g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+# Under gunicorn every worker writes its samples to files in this directory,
+# which are merged when scraped (see gunicorn_conf.py)
+MULTIPROC_DIR_ENV = "PROMETHEUS_MULTIPROC_DIR"
+# Set on the requests workers send themselves to warm their cache, which are not recorded
+WARMUP_ENVIRON_KEY = "strong.warmup"
+
+REQUEST_SECONDS = Histogram(
+    "strong_request_duration_seconds", "Latency of API requests by route.",
+    ["endpoint", "method"],
+)
+REQUESTS = Counter(
+    "strong_requests_total", "API requests by route and status code.",
+    ["endpoint", "method", "status"],
+)
+STAGE_SECONDS = Histogram(
+    "strong_stage_duration_seconds",
+    "Duration of the stages turning a snapshot into responses: extract (streaming and flattening the snapshot), "
+    "insert, tags, indexes, weekly_volume, analytics and serialize.",
+    ["stage"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+UPSTREAM_SECONDS = Histogram(
+    "strong_upstream_request_duration_seconds", "Latency of requests to Strong by operation (auth or fetch).",
+    ["operation"],
+)
+UPSTREAM_RESPONSES = Counter(
+    "strong_upstream_responses_total", "Responses from Strong by operation and status code, error when none came.",
+    ["operation", "status"],
+)
+
+def observe_upstream(operation, started, status):
+    """Records a request to Strong started at the given perf_counter time."""
+    UPSTREAM_SECONDS.labels(operation).observe(time.perf_counter() - started)
+    UPSTREAM_RESPONSES.labels(operation, str(status)).inc()
+
+def timed_rows(rows, stage="extract"):
+    """Passes rows through, recording the time spent producing them as one observation of stage."""
+    spent = 0.0
+    rows = iter(rows)
+    while True:
+        started = time.perf_counter()
+        try:
+            row = next(rows)
+        except StopIteration:
+            break
+        finally:
+            spent += time.perf_counter() - started
+        yield row
+    STAGE_SECONDS.labels(stage).observe(spent)
+
+class SnapshotCollector:
+    """Reports the snapshot size and last successful refresh of every account, read from disk when scraped."""
+
+    def collect(self):
+        from app.accounts import get_accounts
+
+        size = GaugeMetricFamily("strong_snapshot_bytes", "Size of the account's snapshot on disk.", labels=["account"])
+        refreshed = GaugeMetricFamily(
+            "strong_last_refresh_timestamp_seconds", "When the account's snapshot was last written by a successful refresh.",
+            labels=["account"],
+        )
+        for account in get_accounts().values():
+            try:
+                stat = os.stat(account.json_path)
+            except FileNotFoundError:
+                continue
+            size.add_metric([account.name], stat.st_size)
+            refreshed.add_metric([account.name], stat.st_mtime)
+        yield size
+        yield refreshed
+
+def render_metrics():
+    """Returns the exposition of every metric, merged across worker processes when running under gunicorn."""
+    if os.environ.get(MULTIPROC_DIR_ENV):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    snapshots = CollectorRegistry()
+    snapshots.register(SnapshotCollector())
+    return generate_latest(registry) + generate_latest(snapshots), CONTENT_TYPE_LATEST
+
+def init_app(app):
+    """Times every request of the app by route."""
+
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop("request_started", None)
+        if started is not None and not request.environ.get(WARMUP_ENVIRON_KEY):
+            endpoint = request.endpoint or "unmatched"
+            REQUEST_SECONDS.labels(endpoint, request.method).observe(time.perf_counter() - started)
+            REQUESTS.labels(endpoint, request.method, str(response.status_code)).inc()
+        return response
@@ -0,0 +1,25 @@
+class Interner:
+    """
+    Maps strings such as Strong's UUIDs to small integer codes, handed out in
+    order of first appearance, so each string is held once however many rows
+    refer to it.
+    """
+
+    __slots__ = ("codes", "values")
+
+    def __init__(self, values=()):
+        """Starts from values already interned, in code order."""
+        self.values = list(values)
+        self.codes = {value: code for code, value in enumerate(self.values)}
+
+    def code(self, value):
+        """Returns the code of value, interning it on first use."""
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def rows(self):
+        """Yields the (code, value) pairs, in code order."""
+        return enumerate(self.values)
@@ -1,42 +1,341 @@
-from flask import Blueprint, jsonify
-from app.utils import read_csv
+from flask import Blueprint, Response, g, jsonify, request, url_for
+from app.cache import get_cached, snapshot_version, snapshot_last_modified
+from app.utils import (
+    MIN_COMPRESS_SIZE,
+    choose_encoding,
+    compress_response,
+    encode_body,
+    iter_csv,
+    iter_ndjson,
+    json_response,
+    serialize,
+)
 from app.extractor import main
-from app.constants import (
-    BENCH_PRESS_PATH,
-    DEADLIFT_PATH,
-    SQUAT_PATH,
-    OVERHEAD_PRESS_PATH,
-    BODYWEIGHT_PATH,
-    WEEKLY_VOLUME_PATH
+from app.store import (
+    DEFAULT_E1RM_FORMULA,
+    E1RM_FORMULAS,
+    EPOCH,
+    EXPORT_COLUMNS,
+    SERIES_AGGREGATIONS,
+    get_exercise,
+    get_exercises,
+    get_exercise_records,
+    get_exercise_series,
+    get_exercise_sets,
+    get_weekly_volume,
+    get_bodyweight,
+    iter_sets
 )
+from app.accounts import get_account, get_accounts
+from app.constants import TRACKED_EXERCISES, LBS_PER_KG, DEFAULT_ACCOUNT
+from app.metrics import WARMUP_ENVIRON_KEY, render_metrics
+from datetime import datetime, timedelta, timezone
+import math
 
-from app.api import get_data
+from app.jobs import get_job, submit_refresh
+from app.warmup import mark_served
 
 api = Blueprint("api", __name__)
 
+# Factors converting the kg stored by Strong into the units the API can return
+UNIT_FACTORS = {"lbs": LBS_PER_KG, "kg": 1.0}
+
+# Formats of the sets export, with their encoder and content type
+EXPORT_FORMATS = {
+    "ndjson": (iter_ndjson, "application/x-ndjson"),
+    "csv": (lambda rows: iter_csv(rows, EXPORT_COLUMNS), "text/csv"),
+}
+
+# Endpoints whose responses only change when a new snapshot is written
+CONDITIONAL_ENDPOINTS = {
+    "api.fetch_data", "api.exercises", "api.exercise_series", "api.exercise_records", "api.weekly_volume", "api.bodyweight",
+    "api.export_sets",
+}
+
+def account_route(rule, **options):
+    """Registers a route serving the default account, and the same route under /accounts/<account> for the others."""
+    def decorator(view):
+        api.add_url_rule(rule, view_func=view, **options)
+        api.add_url_rule(f"/accounts/<account>{rule}", view_func=view, **options)
+        return view
+    return decorator
+
+@api.url_value_preprocessor
+def pull_account(endpoint, values):
+    g.account = get_account(values.pop("account", DEFAULT_ACCOUNT) if values else DEFAULT_ACCOUNT)
+
+@api.before_request
+def check_account():
+    if g.get("account") is None:
+        return jsonify({"error": "Unknown account"}), 404
+    # The cache warmer keeps the accounts whose data this worker serves warm
+    if request.endpoint in CONDITIONAL_ENDPOINTS and not request.environ.get(WARMUP_ENVIRON_KEY):
+        mark_served(g.account.name)
+    return None
+
+@api.before_request
+def check_not_modified():
+    """Answers 304 before doing any work when the client already has the current snapshot's data."""
+    if request.endpoint not in CONDITIONAL_ENDPOINTS:
+        return None
+    g.snapshot_version = snapshot_version(g.account.json_path)
+    g.snapshot_last_modified = snapshot_last_modified(g.account.json_path)
+    if g.snapshot_version is None:
+        return None
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains_weak(g.snapshot_version)
+    else:
+        not_modified = bool(
+            request.if_modified_since
+            and request.if_modified_since >= g.snapshot_last_modified.replace(microsecond=0)
+        )
+    if not_modified:
+        response = Response(status=304)
+        response.set_etag(g.snapshot_version, weak=True)
+        return response
+    return None
+
+@api.after_request
+def finalize_response(response):
+    """Tags snapshot-backed responses for conditional requests and compresses the body."""
+    if request.endpoint in CONDITIONAL_ENDPOINTS and response.status_code == 200 and g.get("snapshot_version"):
+        response.set_etag(g.snapshot_version, weak=True)
+        response.last_modified = g.snapshot_last_modified
+        # Clients may keep the data but must revalidate it on every load
+        response.cache_control.no_cache = True
+    # Warm-up responses are thrown away, only the cache they filled matters
+    if request.environ.get(WARMUP_ENVIRON_KEY):
+        return response
+    return compress_response(response, request.accept_encodings)
+
 @api.route("/", methods=["GET"])
 def home():
     """Root route that returns a greeting."""
     return "Welcome to the Workout Data API!"
 
-@api.route("/refresh_data", methods=["GET"])
+@api.route("/metrics", methods=["GET"])
+def metrics():
+    """Exposes the Prometheus metrics of every worker process."""
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
+
+@api.route("/accounts", methods=["GET"])
+def accounts():
+    """Lists the accounts served by this deployment."""
+    return jsonify([{"name": account.name, "url": url_for("api.fetch_data", account=account.name)} for account in get_accounts().values()])
+
+@account_route("/version", methods=["GET"])
+def version():
+    """Returns the version of the current snapshot, so clients can tell when their cached data is stale."""
+    last_modified = snapshot_last_modified(g.account.json_path)
+    return jsonify({
+        "version": snapshot_version(g.account.json_path),
+        "last_modified": last_modified and last_modified.isoformat(),
+    })
+
+@account_route("/refresh_data", methods=["GET", "POST"])
 def refresh_data():
-    """Refreshes the data.json"""
-    result = get_data()
-    return jsonify(result)
+    """
+    Queues a refresh of data.json in the background and returns its job,
+    pass ?full=true to re-download the whole history.
+    """
+    job = submit_refresh(request.args.get("full", "false").lower() == "true", g.account)
+    status_url = url_for("api.job_status", job_id=job.id)
+    response = jsonify({"job_id": job.id, "status": job.status, "status_url": status_url})
+    response.status_code = 202
+    response.headers["Location"] = status_url
+    return response
+
+@api.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    """Reports the progress, download counters and stage timings of a refresh job."""
+    job = get_job(job_id)
+    if not job:
+        return jsonify({"error": f"Unknown job {job_id}"}), 404
+    return jsonify(job)
+
+def cached(name, build):
+    """Returns the cached result of build() for the snapshot of the requested account."""
+    return get_cached(f"{g.account.name}:{name}", build, g.account.json_path)
+
+def ensure_store():
+    """Brings the store of the requested account up to date with its data.json."""
+    account = g.account
+    cached("store", lambda: main(account))
+    return account.store_path
+
+def build_dashboard_data():
+    """Brings the store up to date with data.json and reads the dashboard data from it."""
+    path = ensure_store()
+    data = {key: get_exercise_sets(exercise_id, path) for key, exercise_id in TRACKED_EXERCISES.items()}
+    data["weekly_volume"] = get_weekly_volume(path=path)
+    data["bodyweight"] = get_bodyweight(path=path)
+    return data
 
-@api.route("/fetch_data", methods=["GET"])
+@account_route("/fetch_data", methods=["GET"])
 def fetch_data():
-    """Fetches workout data from extracted CSVs and returns JSON."""
-    main()  # Runs the extractor script
-
-    data = {
-        "bench_press": read_csv(BENCH_PRESS_PATH) or [],
-        "deadlift": read_csv(DEADLIFT_PATH) or [],
-        "squat": read_csv(SQUAT_PATH) or [],
-        "overhead_press": read_csv(OVERHEAD_PRESS_PATH) or [],
-        "weekly_volume": read_csv(WEEKLY_VOLUME_PATH) or [],
-        "bodyweight": read_csv(BODYWEIGHT_PATH) or [],
-    }
-
-    return jsonify(data)
+    """
+    Returns the dashboard data, querying the store only when data.json
+    changed. It is cached serialized: one flat bytes object per snapshot,
+    which workers forked after a preload share with the master.
+    """
+    body = cached("fetch_data", lambda: serialize(build_dashboard_data()))
+    encoding = choose_encoding(request.accept_encodings) if len(body) >= MIN_COMPRESS_SIZE else None
+    if not encoding:
+        return json_response(body)
+    # Compressed once per snapshot and encoding rather than on every response
+    response = json_response(cached(f"fetch_data:{encoding}", lambda: encode_body(body, encoding)))
+    response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    return response
+
+def parse_time_range():
+    """
+    Parses the ISO date or datetime `since` and `until` query arguments into
+    UTC datetimes. `until` is inclusive, a bare date covering the whole day,
+    so it is returned as an exclusive upper bound.
+    """
+    bounds = []
+    for name in ("since", "until"):
+        value = request.args.get(name)
+        if not value:
+            bounds.append(None)
+            continue
+        parsed = datetime.fromisoformat(value)
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        parsed = parsed.astimezone(timezone.utc)
+        if name == "until":
+            parsed += timedelta(days=1) if len(value) == 10 else timedelta(seconds=1)
+        bounds.append(parsed)
+    return bounds
+
+def timestamp_bounds(since, until):
+    """Converts a time range into the epoch seconds the store keeps timestamps as."""
+    return (
+        since and math.ceil(since.timestamp()),
+        until and math.ceil(until.timestamp()),
+    )
+
+def week_bounds(since, until):
+    """Converts a time range into the epoch days of the closing Sundays the store labels weeks with."""
+    return (
+        since and (since.date() - EPOCH).days,
+        until and ((until - timedelta(microseconds=1)).date() + timedelta(days=1) - EPOCH).days,
+    )
+
+def parse_unit_arg():
+    """Returns the factor converting stored kg into the requested unit."""
+    unit = request.args.get("unit", "lbs").lower()
+    if unit not in UNIT_FACTORS:
+        raise ValueError(f"unit must be one of {', '.join(UNIT_FACTORS)}")
+    return UNIT_FACTORS[unit]
+
+def parse_formula_arg():
+    """Returns the formula 1RM estimates are computed with."""
+    formula = request.args.get("formula", DEFAULT_E1RM_FORMULA).lower()
+    if formula not in E1RM_FORMULAS:
+        raise ValueError(f"formula must be one of {', '.join(E1RM_FORMULAS)}")
+    return formula
+
+def parse_list_arg(name):
+    """Returns the comma-separated values of a query argument, empty when it is missing."""
+    return [value for value in request.args.get(name, "").split(",") if value]
+
+@account_route("/exercises", methods=["GET"])
+def exercises():
+    """Returns the catalogue of exercises, with their tag and number of logged sets."""
+    path = ensure_store()
+    return json_response(cached("exercises", lambda: get_exercises(path)))
+
+@account_route("/exercises/<exercise_id>/series", methods=["GET"])
+def exercise_series(exercise_id):
+    """Returns one aggregated point per session of an exercise, read from the precomputed session bests for best_e1rm."""
+    path = ensure_store()
+    agg = request.args.get("agg", "best_e1rm")
+    if agg not in SERIES_AGGREGATIONS:
+        return jsonify({"error": f"agg must be one of {', '.join(SERIES_AGGREGATIONS)}"}), 400
+    try:
+        since, until = timestamp_bounds(*parse_time_range())
+        factor = parse_unit_arg()
+        formula = parse_formula_arg()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    exercise = get_exercise(exercise_id, path)
+    if not exercise:
+        return jsonify({"error": f"Unknown exercise {exercise_id}"}), 404
+    # Series are computed on first request and kept in the worker's LRU cache
+    series = cached(
+        f"series:{exercise_id}:{agg}:{since}:{until}:{factor}:{formula}",
+        lambda: get_exercise_series(exercise_id, agg, since, until, factor, formula, path),
+    )
+    if agg == "best_e1rm":
+        exercise["formula"] = formula
+    return json_response({**exercise, "agg": agg, "series": series})
+
+@account_route("/exercises/<exercise_id>/records", methods=["GET"])
+def exercise_records(exercise_id):
+    """Returns the all-time 1RM estimate PRs and the rep-max records of an exercise."""
+    path = ensure_store()
+    try:
+        factor = parse_unit_arg()
+        formula = parse_formula_arg()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    exercise = get_exercise(exercise_id, path)
+    if not exercise:
+        return jsonify({"error": f"Unknown exercise {exercise_id}"}), 404
+    records = cached(
+        f"records:{exercise_id}:{factor}:{formula}",
+        lambda: get_exercise_records(exercise_id, formula, factor, path),
+    )
+    return json_response({**exercise, "formula": formula, **records})
+
+@account_route("/volume/weekly", methods=["GET"])
+def weekly_volume():
+    """Returns the weekly working sets per muscle group, optionally restricted to some tags."""
+    path = ensure_store()
+    try:
+        since, until = week_bounds(*parse_time_range())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    tags = parse_list_arg("tags")
+    return json_response(get_weekly_volume(since, until, tags, path))
+
+@account_route("/bodyweight", methods=["GET"])
+def bodyweight():
+    """Returns the bodyweight entries within the requested time range."""
+    path = ensure_store()
+    try:
+        since, until = timestamp_bounds(*parse_time_range())
+        factor = parse_unit_arg()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return json_response(get_bodyweight(since, until, factor, path))
+
+@account_route("/export", methods=["GET"])
+def export_sets():
+    """
+    Streams every set of the account as NDJSON or CSV, optionally filtered
+    by exercise UUIDs, tags and time range. Rows are encoded in chunks as
+    they are read from the store, so the first bytes go out right away and
+    memory stays flat however long the history is.
+    """
+    path = ensure_store()
+    export_format = request.args.get("format", "ndjson").lower()
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({"error": f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+    try:
+        since, until = timestamp_bounds(*parse_time_range())
+        factor = parse_unit_arg()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    encode, mimetype = EXPORT_FORMATS[export_format]
+    rows = iter_sets(parse_list_arg("exercises"), parse_list_arg("tags"), since, until, factor, path)
+    # Passed through untouched: the body is never buffered, so it is not compressed either
+    response = Response(encode(rows), mimetype=mimetype, direct_passthrough=True)
+    response.headers["Content-Disposition"] = f'attachment; filename="{g.account.name}-sets.{export_format}"'
+    return response
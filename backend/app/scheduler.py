@@ -0,0 +1,64 @@
+import json
+import os
+import random
+import socket
+import time
+from app.accounts import get_account
+from app.api import refresh_all
+from app.constants import SCHEDULER_LEASE_PATH, SCHEDULER_LEASE_SECONDS, SCHEDULER_JITTER_SECONDS
+from app.extractor import main
+from app.logger import logger
+from app.utils import atomic_write, file_lock
+
+# Time for the lease writes of other nodes to land before checking who won
+LEASE_SETTLE_SECONDS = 1
+
+def read_lease(path=SCHEDULER_LEASE_PATH):
+    """Returns the owner and expiry of the lease, or None when there is none or it is unreadable."""
+    try:
+        with open(path, "r") as file:
+            lease = json.load(file)
+        return {"owner": lease["owner"], "expires_at": float(lease["expires_at"])}
+    except (OSError, json.JSONDecodeError, KeyError, TypeError, ValueError):
+        return None
+
+def acquire_lease(path=SCHEDULER_LEASE_PATH, ttl=SCHEDULER_LEASE_SECONDS):
+    """
+    Takes the scheduler lease for ttl seconds unless another process or node
+    holds a live one. The lease is kept until it expires, so schedulers
+    firing later for the same run find it taken and skip.
+    """
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    with file_lock(path):
+        lease = read_lease(path)
+        now = time.time()
+        if lease and lease["expires_at"] > now and lease["owner"] != owner:
+            return False
+        with atomic_write(path) as file:
+            json.dump({"owner": owner, "expires_at": now + ttl}, file)
+    # File locks do not span nodes sharing the data directory, the last writer wins the lease
+    time.sleep(LEASE_SETTLE_SECONDS)
+    lease = read_lease(path)
+    return bool(lease) and lease["owner"] == owner
+
+def run_scheduled_refresh():
+    """
+    Refreshes every account if this process wins the scheduler lease, then
+    rebuilds the store of each refreshed account so no request has to.
+    Returns the refresh results, or None when another process ran them.
+    """
+    # Schedulers of every node fire at the same second, jitter spreads their attempts at the lease
+    time.sleep(random.uniform(0, SCHEDULER_JITTER_SECONDS))
+    if not acquire_lease():
+        logger.info("⏭️ Another process holds the scheduler lease, skipping this refresh.")
+        return None
+
+    results = refresh_all()
+    for name, result in results.items():
+        if result.get("status") != "success":
+            continue
+        try:
+            main(get_account(name))
+        except Exception as e:
+            logger.error(f"❌ Rebuilding the store of account {name} failed: {e}")
+    return results
@@ -0,0 +1,135 @@
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from app.constants import DATA_DIR, JSON_FILE_PATH, SNAPSHOT_COMPRESSION_LEVEL
+from app.jsonstream import iter_embedded
+from app.utils import atomic_write, file_lock
+
+# gzip files start with these two bytes, plain JSON snapshots never do
+GZIP_MAGIC = b"\x1f\x8b"
+
+@contextmanager
+def write_snapshot(path=JSON_FILE_PATH):
+    """Opens a text stream atomically replacing the snapshot at path with its gzip-compressed content."""
+    with atomic_write(path, "wb") as raw:
+        # mtime=0 keeps the bytes of a snapshot independent of when it was written
+        with gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=SNAPSHOT_COMPRESSION_LEVEL, mtime=0) as compressed:
+            with io.TextIOWrapper(compressed, encoding="utf-8") as file:
+                yield file
+
+def read_snapshot(file):
+    """Wraps a snapshot opened in binary mode into a text stream, decompressing it on the fly."""
+    if file.peek(len(GZIP_MAGIC))[:len(GZIP_MAGIC)] == GZIP_MAGIC:
+        file = gzip.GzipFile(fileobj=file, mode="rb")
+    return io.TextIOWrapper(file, encoding="utf-8")
+
+def migrate_snapshot(legacy_path, path=JSON_FILE_PATH):
+    """Compresses a snapshot left uncompressed by an older version into path, once."""
+    if not os.path.exists(legacy_path) or os.path.exists(path):
+        return
+    with file_lock(path):
+        if not os.path.exists(legacy_path) or os.path.exists(path):
+            return
+        with open(legacy_path, "rb") as source, write_snapshot(path) as file:
+            shutil.copyfileobj(read_snapshot(source), file)
+        os.remove(legacy_path)
+
+class SnapshotWriter:
+    """
+    Spools synced items on disk, one file per resource, then streams them
+    into the snapshot merged with the previous one. Items are kept as the
+    JSON text they were received as and only their ids are held in memory,
+    so syncing costs the same memory whatever the history length.
+    """
+
+    def __init__(self):
+        self.spool_dir = tempfile.mkdtemp(prefix="sync-", dir=DATA_DIR)
+        self.spools = {}
+        self.ids = {}
+        self.links = {}
+        self.count = 0
+
+    def add(self, resource, item, text=None):
+        """Spools an item, as its JSON text when given to save encoding it again."""
+        if resource not in self.spools:
+            self.spools[resource] = open(os.path.join(self.spool_dir, f"{resource}.json"), "w")
+            self.ids[resource] = set()
+        else:
+            self.spools[resource].write(",")
+        self.spools[resource].write(json.dumps(item) if text is None else text)
+        self.ids[resource].add(item.get("id"))
+        self.count += 1
+
+    def write_resource(self, file, resource, previous_items, first):
+        """Writes one `_embedded` array: the previous items not synced again, then the synced ones."""
+        if not first:
+            file.write(",")
+        file.write(f"{json.dumps(resource)}:[")
+        separator = ""
+        replaced = self.ids.get(resource, set())
+        for item, text in previous_items:
+            if item.get("id") in replaced:
+                continue
+            file.write(separator + text)
+            separator = ","
+        if resource in self.spools:
+            self.spools[resource].close()
+            with open(os.path.join(self.spool_dir, f"{resource}.json"), "r") as spool:
+                file.write(separator)
+                shutil.copyfileobj(spool, file)
+        file.write("]")
+
+    def write(self, path=JSON_FILE_PATH, merge=False):
+        """
+        Writes the compressed snapshot to path. When merging, items of the
+        existing snapshot are copied through unless a synced version replaces them.
+        """
+        with write_snapshot(path) as file:
+            file.write(f'{{"_links":{json.dumps(self.links)},"_embedded":{{')
+            written = set()
+            if merge and os.path.exists(path):
+                with open(path, "rb") as previous:
+                    items = ((resource, (item, text)) for resource, item, text in iter_embedded(read_snapshot(previous), raw=True))
+                    for resource, group in group_by_resource(items):
+                        self.write_resource(file, resource, group, not written)
+                        written.add(resource)
+            for resource in self.spools:
+                if resource not in written:
+                    self.write_resource(file, resource, [], not written)
+                    written.add(resource)
+            file.write("}}")
+
+    def items(self):
+        """Yields the synced (resource, item) pairs, read back from the spools."""
+        for resource, spool in self.spools.items():
+            spool.close()
+            with open(os.path.join(self.spool_dir, f"{resource}.json"), "r") as file:
+                for item in json.loads(f"[{file.read()}]"):
+                    yield resource, item
+
+    def close(self):
+        for spool in self.spools.values():
+            spool.close()
+        shutil.rmtree(self.spool_dir, ignore_errors=True)
+
+def group_by_resource(items):
+    """Groups consecutive (resource, item) pairs into (resource, items) without buffering them."""
+    items = iter(items)
+    pending = next(items, None)
+    while pending is not None:
+        resource = pending[0]
+
+        def group():
+            nonlocal pending
+            while pending is not None and pending[0] == resource:
+                yield pending[1]
+                pending = next(items, None)
+
+        yield resource, group()
+        # Drain whatever the caller did not consume before moving to the next resource
+        for _ in group():
+            pass
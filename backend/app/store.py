@@ -0,0 +1,615 @@
+import math
+import os
+import shutil
+import sqlite3
+import time
+from contextlib import closing, contextmanager
+from datetime import date, timedelta
+from app.constants import STORE_PATH, STORE_MMAP_BYTES, LBS_PER_KG, REP_MAX_REPS
+from app.logger import logger
+from app.metrics import STAGE_SECONDS, timed_rows
+
+# Exercise and tag UUIDs are interned to integer codes and times stored as
+# epoch seconds (weeks as epoch days), keeping a set row to a few integers
+TABLES = """
+CREATE TABLE meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE exercise_codes (
+    code INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE
+);
+CREATE TABLE tag_codes (
+    code INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE
+);
+CREATE TABLE exercises (
+    code INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    tag INTEGER
+);
+CREATE TABLE workouts (
+    code INTEGER PRIMARY KEY,
+    id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    time INTEGER NOT NULL,
+    week INTEGER NOT NULL
+);
+CREATE TABLE sets (
+    workout INTEGER NOT NULL,
+    exercise INTEGER NOT NULL,
+    tag INTEGER,
+    time INTEGER NOT NULL,
+    week INTEGER NOT NULL,
+    weight REAL,
+    reps INTEGER,
+    rpe REAL,
+    is_warmup INTEGER NOT NULL,
+    is_hidden INTEGER NOT NULL
+);
+CREATE TABLE weekly_volume (
+    tag INTEGER NOT NULL,
+    week INTEGER NOT NULL,
+    sets INTEGER NOT NULL,
+    PRIMARY KEY (week, tag)
+) WITHOUT ROWID;
+CREATE TABLE session_bests (
+    exercise INTEGER NOT NULL,
+    formula TEXT NOT NULL,
+    time INTEGER NOT NULL,
+    workout INTEGER NOT NULL,
+    e1rm REAL NOT NULL,
+    weight REAL NOT NULL,
+    reps INTEGER NOT NULL,
+    pr REAL NOT NULL,
+    is_pr INTEGER NOT NULL,
+    PRIMARY KEY (exercise, formula, time)
+) WITHOUT ROWID;
+CREATE TABLE rep_maxes (
+    exercise INTEGER NOT NULL,
+    reps INTEGER NOT NULL,
+    time INTEGER NOT NULL,
+    workout INTEGER NOT NULL,
+    weight REAL NOT NULL,
+    PRIMARY KEY (exercise, reps, time)
+) WITHOUT ROWID;
+CREATE TABLE body_measurements (
+    id TEXT NOT NULL,
+    type TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    time INTEGER NOT NULL,
+    value REAL
+);
+"""
+
+INDEXES = """
+CREATE INDEX idx_sets_exercise_time ON sets (exercise, time);
+CREATE INDEX idx_sets_week ON sets (week);
+CREATE INDEX idx_sets_workout ON sets (workout);
+CREATE INDEX idx_workouts_id ON workouts (id);
+CREATE INDEX idx_body_measurements_type_time ON body_measurements (type, time);
+CREATE INDEX idx_body_measurements_id ON body_measurements (id);
+"""
+
+INSERTS = {
+    "exercise_codes": "INSERT INTO exercise_codes (code, id) VALUES (?, ?)",
+    "tag_codes": "INSERT INTO tag_codes (code, id) VALUES (?, ?)",
+    "exercises": "INSERT INTO exercises (code, name, tag) VALUES (?, ?, ?)",
+    "workouts": "INSERT INTO workouts (code, id, timestamp, time, week) VALUES (?, ?, ?, ?, ?)",
+    "sets": "INSERT INTO sets (workout, exercise, time, week, weight, reps, rpe, is_warmup, is_hidden) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+    "body_measurements": "INSERT INTO body_measurements (id, type, timestamp, time, value) VALUES (?, ?, ?, ?, ?)",
+}
+# Synced items replace the rows they were extracted from before, codes and exercises included
+UPSERTS = {table: insert.replace("INSERT", "INSERT OR REPLACE", 1) for table, insert in INSERTS.items()}
+BATCH_SIZE = 1000
+# Bumped whenever the tables or the formulas filling them change, so stores built by older code are rebuilt
+SCHEMA_VERSION = "7"
+
+EPOCH = date(1970, 1, 1)
+
+# One-rep max estimates of a set by formula. Brzycki and Lander diverge past 36 reps, where they give no estimate
+E1RM_FORMULAS = {
+    "epley": "weight * (1 + reps / 30.0)",
+    "brzycki": "CASE WHEN reps < 37 THEN weight * 36.0 / (37 - reps) END",
+    "lander": "CASE WHEN reps < 37 THEN weight * 100.0 / (101.3 - 2.67123 * reps) END",
+    "lombardi": "weight * power(reps, 0.1)",
+    "oconner": "weight * (1 + reps / 40.0)",
+}
+DEFAULT_E1RM_FORMULA = "epley"
+
+# Aggregations of a set series: best_e1rm is read from the session_bests
+# table, the others aggregated per session, both ? are the weight unit factor
+SERIES_AGGREGATIONS = ("best_e1rm", "max_weight", "volume")
+SESSION_AGGREGATIONS = {
+    "max_weight": "MAX(weight) * ? AS value, weight * ? AS weight, reps",
+    "volume": "SUM(weight * reps) * ? AS value, MAX(weight) * ? AS weight, SUM(reps) AS reps",
+}
+
+def connect(path=STORE_PATH):
+    """
+    Opens a read-only connection to the store. Pages are read through a
+    memory map of the file, so every worker shares the OS page cache instead
+    of copying the pages it reads into a cache of its own.
+    """
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    connection.row_factory = sqlite3.Row
+    connection.execute(f"PRAGMA mmap_size = {STORE_MMAP_BYTES}")
+    return connection
+
+def get_store_version(path=STORE_PATH):
+    """Returns the snapshot version the store was built from, or None if there is no store."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with closing(connect(path)) as connection:
+            meta = dict(connection.execute("SELECT key, value FROM meta").fetchall())
+    except sqlite3.DatabaseError as e:
+        logger.warning(f"⚠️ Store at {path} is unreadable: {e}")
+        return None
+    if meta.get("schema") != SCHEMA_VERSION:
+        return None
+    return meta.get("version")
+
+def build_store(version, rows, path=STORE_PATH):
+    """
+    Writes the (table, row) pairs streamed by the extractor into a fresh
+    store in batches and swaps it in place of the old one, so readers never
+    see a half-built database and memory stays flat whatever the history size.
+    """
+    logger.info(f"Building store at {path}...")
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    with closing(sqlite3.connect(tmp_path)) as connection:
+        connection.executescript(TABLES)
+        connection.executemany(
+            "INSERT INTO meta (key, value) VALUES (?, ?)",
+            [("version", version), ("schema", SCHEMA_VERSION)],
+        )
+        batches = {table: [] for table in INSERTS}
+        counts = dict.fromkeys(INSERTS, 0)
+        inserting = 0.0
+        for table, row in timed_rows(rows):
+            batch = batches[table]
+            batch.append(row)
+            if len(batch) >= BATCH_SIZE:
+                started = time.perf_counter()
+                connection.executemany(INSERTS[table], batch)
+                inserting += time.perf_counter() - started
+                counts[table] += len(batch)
+                batch.clear()
+        started = time.perf_counter()
+        for table, batch in batches.items():
+            connection.executemany(INSERTS[table], batch)
+            counts[table] += len(batch)
+        STAGE_SECONDS.labels("insert").observe(inserting + time.perf_counter() - started)
+
+        # Logs may be streamed before the exercises, so sets get their tag once everything is loaded
+        with STAGE_SECONDS.labels("tags").time():
+            connection.execute("UPDATE sets SET tag = (SELECT tag FROM exercises WHERE exercises.code = sets.exercise)")
+        with STAGE_SECONDS.labels("indexes").time():
+            connection.executescript(INDEXES)
+        connection.executescript(AFFECTED_TABLES)
+        connection.execute("INSERT INTO affected_weeks SELECT DISTINCT week FROM sets")
+        connection.execute("INSERT INTO affected_exercises SELECT exercise, MIN(time) FROM sets GROUP BY exercise")
+        update_derived_tables(connection)
+        connection.commit()
+
+    os.replace(tmp_path, path)
+    logger.info(f"✅ Store built with {counts['workouts']} workouts and {counts['sets']} sets.")
+
+# Weeks whose derived rows are counted again, exercises whose analytics are
+# computed again from their earliest changed time, everything in a new store,
+# and the workouts an update replaces. Temporary, so they never reach the file
+AFFECTED_TABLES = """
+CREATE TEMP TABLE affected_weeks (week INTEGER PRIMARY KEY);
+CREATE TEMP TABLE affected_exercises (exercise INTEGER PRIMARY KEY, since INTEGER NOT NULL);
+CREATE TEMP TABLE changed_workouts (code INTEGER PRIMARY KEY);
+"""
+
+class StoreUpdate:
+    """
+    Applies the rows extracted from synced items to a copy of the store.
+    The rows the items were extracted from before are removed first, and
+    the weeks and exercises of both the old and the new workouts marked as
+    affected, so updating the derived tables only counts those weeks again
+    and only computes the analytics of those exercises from their earliest
+    changed session on.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        connection.executescript(AFFECTED_TABLES)
+        # Workouts of the update are numbered after the last one, codes of deleted workouts are not reused
+        self.first_workout = connection.execute("SELECT COALESCE(MAX(code) + 1, 0) FROM workouts").fetchone()[0]
+        self.count = 0
+
+    def codes(self):
+        """Returns the exercise and tag UUIDs by code and the first free workout code, to extract the items with."""
+        exercises = [id for id, in self.connection.execute("SELECT id FROM exercise_codes ORDER BY code")]
+        tags = [id for id, in self.connection.execute("SELECT id FROM tag_codes ORDER BY code")]
+        return exercises, tags, self.first_workout
+
+    def mark_changed_workouts(self):
+        """Marks the weeks of the changed_workouts and the exercises of their sets, from the earliest one, as affected."""
+        self.connection.execute(
+            "INSERT OR IGNORE INTO affected_weeks SELECT week FROM workouts WHERE code IN (SELECT code FROM changed_workouts)"
+        )
+        self.connection.execute(
+            "INSERT INTO affected_exercises (exercise, since) "
+            "SELECT exercise, MIN(time) FROM sets WHERE workout IN (SELECT code FROM changed_workouts) GROUP BY exercise "
+            "ON CONFLICT (exercise) DO UPDATE SET since = MIN(since, excluded.since)"
+        )
+
+    def remove(self, workout_ids, measured_value_ids):
+        """Removes the workouts and body measurements with these ids, along with the sets of the workouts."""
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO changed_workouts SELECT code FROM workouts WHERE id = ?", ((id,) for id in workout_ids)
+        )
+        self.mark_changed_workouts()
+        self.connection.execute("DELETE FROM sets WHERE workout IN (SELECT code FROM changed_workouts)")
+        self.connection.execute("DELETE FROM workouts WHERE code IN (SELECT code FROM changed_workouts)")
+        self.connection.execute("DELETE FROM changed_workouts")
+        self.connection.executemany("DELETE FROM body_measurements WHERE id = ?", ((id,) for id in measured_value_ids))
+
+    def insert(self, rows):
+        """
+        Inserts the (table, row) pairs extracted from the synced items,
+        replacing the exercises and codes they redefine. Every week of an
+        exercise whose tag changed is affected, as its sets move to the new tag.
+        """
+        retagged = []
+        for table, row in rows:
+            if table == "exercises":
+                code, _, tag = row
+                previous = self.connection.execute("SELECT tag FROM exercises WHERE code = ?", (code,)).fetchone()
+                if previous is not None and previous[0] != tag:
+                    retagged.append((tag, code))
+            self.connection.execute(UPSERTS[table], row)
+            self.count += 1
+
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO affected_weeks SELECT DISTINCT week FROM sets WHERE exercise = ?",
+            ((code,) for _, code in retagged),
+        )
+        self.connection.executemany("UPDATE sets SET tag = ? WHERE exercise = ?", retagged)
+        self.connection.execute("INSERT INTO changed_workouts SELECT code FROM workouts WHERE code >= ?", (self.first_workout,))
+        self.connection.execute(
+            "UPDATE sets SET tag = (SELECT tag FROM exercises WHERE exercises.code = sets.exercise) "
+            "WHERE workout IN (SELECT code FROM changed_workouts)"
+        )
+        self.mark_changed_workouts()
+        self.connection.execute("DELETE FROM changed_workouts")
+
+@contextmanager
+def update_store(version, path=STORE_PATH):
+    """
+    Yields a StoreUpdate of a copy of the store, then updates the derived
+    tables of the weeks and exercises it affected and swaps the copy in place of the
+    store, so readers never see a half-applied update.
+    """
+    logger.info(f"Updating store at {path}...")
+    tmp_path = f"{path}.tmp"
+    shutil.copyfile(path, tmp_path)
+    with closing(sqlite3.connect(tmp_path)) as connection:
+        update = StoreUpdate(connection)
+        yield update
+        update_derived_tables(connection)
+        connection.execute("UPDATE meta SET value = ? WHERE key = 'version'", (version,))
+        connection.commit()
+
+    os.replace(tmp_path, path)
+    logger.info(f"✅ Store updated with {update.count} rows.")
+
+def update_weekly_volume(connection):
+    """Counts the working sets per tag of the affected weeks into the weekly_volume rollup, in place of their old counts."""
+    connection.execute("DELETE FROM weekly_volume WHERE week IN (SELECT week FROM affected_weeks)")
+    connection.execute(
+        "INSERT INTO weekly_volume (tag, week, sets) "
+        "SELECT tag, week, COUNT(*) FROM sets "
+        "WHERE week IN (SELECT week FROM affected_weeks) AND NOT is_warmup AND NOT is_hidden AND tag IS NOT NULL "
+        "GROUP BY tag, week"
+    )
+
+# Records of each affected exercise before its earliest changed time, which
+# the sessions from then on are compared to. Materialized, so each is looked
+# up once and only the sets of the affected exercises are read, by index
+SESSION_BEST_SEEDS = """
+WITH seeds AS MATERIALIZED (
+    SELECT exercise, since, (
+        SELECT MAX(e1rm) FROM session_bests
+        WHERE session_bests.exercise = affected_exercises.exercise AND formula = :formula AND time < since
+    ) AS seed
+    FROM affected_exercises
+)
+"""
+REP_MAX_SEEDS = """
+WITH seeds AS MATERIALIZED (
+    SELECT exercise, since, (
+        SELECT MAX(weight) FROM rep_maxes
+        WHERE rep_maxes.exercise = affected_exercises.exercise AND reps = :reps AND time < since
+    ) AS seed
+    FROM affected_exercises
+)
+"""
+
+# Best set of every session of the affected exercises from their earliest
+# changed time, by one formula, ties going to the first set logged, with the
+# all-time best up to each session
+SESSION_BESTS = SESSION_BEST_SEEDS + """
+INSERT INTO session_bests (exercise, formula, time, workout, e1rm, weight, reps, pr, is_pr)
+SELECT exercise, :formula, time, workout, e1rm, weight, reps,
+    COALESCE(MAX(seed, best), best),
+    e1rm > COALESCE(MAX(seed, previous), seed, previous, 0)
+FROM (
+    SELECT exercise, time, workout, e1rm, weight, reps, seed,
+        MAX(e1rm) OVER (PARTITION BY exercise ORDER BY time) AS best,
+        MAX(e1rm) OVER (PARTITION BY exercise ORDER BY time ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING) AS previous
+    FROM (
+        SELECT exercise, time, workout, e1rm, weight, reps, seed,
+            ROW_NUMBER() OVER (PARTITION BY exercise, time ORDER BY e1rm DESC, position) AS rank
+        FROM (
+            SELECT sets.rowid AS position, sets.exercise, time, workout, weight, reps, {e1rm} AS e1rm, seed FROM sets
+            JOIN seeds ON seeds.exercise = sets.exercise AND sets.time >= seeds.since
+            WHERE weight IS NOT NULL AND reps > 0
+        ) WHERE e1rm IS NOT NULL
+    ) WHERE rank = 1
+)
+"""
+
+# Sessions of the affected exercises from their earliest changed time that
+# beat the heaviest weight lifted for at least :reps reps so far
+REP_MAXES = REP_MAX_SEEDS + """
+INSERT INTO rep_maxes (exercise, reps, time, workout, weight)
+SELECT exercise, :reps, time, workout, weight FROM (
+    SELECT exercise, time, workout, weight, COALESCE(MAX(seed, previous), seed, previous) AS heaviest
+    FROM (
+        SELECT exercise, time, workout, weight, seed,
+            MAX(weight) OVER (PARTITION BY exercise ORDER BY time ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING) AS previous
+        FROM (
+            SELECT sets.exercise, time, workout, MAX(weight) AS weight, seed FROM sets
+            JOIN seeds ON seeds.exercise = sets.exercise AND sets.time >= seeds.since
+            WHERE reps >= :reps AND weight > 0
+            GROUP BY sets.exercise, time
+        )
+    )
+) WHERE heaviest IS NULL OR weight > heaviest
+"""
+
+def register_math_functions(connection):
+    """Registers the math functions the formulas use when SQLite was built without them."""
+    try:
+        connection.execute("SELECT power(1, 1)")
+    except sqlite3.OperationalError:
+        connection.create_function("power", 2, math.pow, deterministic=True)
+
+def update_analytics(connection):
+    """
+    Computes the session_bests and rep_maxes rows of the affected exercises
+    again from their earliest changed time. Every running record depends
+    on the sessions before it, so the sessions from then on are computed
+    together, starting from the records already held before that time.
+    """
+    register_math_functions(connection)
+    for table in ("session_bests", "rep_maxes"):
+        connection.execute(
+            f"DELETE FROM {table} WHERE EXISTS (SELECT 1 FROM affected_exercises "
+            f"WHERE affected_exercises.exercise = {table}.exercise AND {table}.time >= affected_exercises.since)"
+        )
+    for formula, e1rm in E1RM_FORMULAS.items():
+        connection.execute(SESSION_BESTS.format(e1rm=e1rm), {"formula": formula})
+    for reps in REP_MAX_REPS:
+        connection.execute(REP_MAXES, {"reps": reps})
+
+def update_derived_tables(connection):
+    """Updates the rollup of the affected weeks and the analytics of the affected exercises of a store being built or updated."""
+    with STAGE_SECONDS.labels("weekly_volume").time():
+        update_weekly_volume(connection)
+    with STAGE_SECONDS.labels("analytics").time():
+        update_analytics(connection)
+
+def to_records(rows):
+    """Turns store rows into the list of dictionaries served by the API."""
+    return [{key: "" if row[key] is None else row[key] for key in row.keys()} for row in rows]
+
+def epoch_day_label(week):
+    """Formats a week stored as epoch days as its ISO date."""
+    return (EPOCH + timedelta(days=week)).isoformat()
+
+def get_exercise_code(connection, exercise_id):
+    """Returns the code an exercise UUID was interned to, or None if it is unknown."""
+    row = connection.execute("SELECT code FROM exercise_codes WHERE id = ?", (exercise_id,)).fetchone()
+    return row["code"] if row else None
+
+def get_exercise_sets(exercise_id, path=STORE_PATH):
+    """Returns every set with a weight and reps for an exercise, in lbs and in chronological order."""
+    with closing(connect(path)) as connection:
+        rows = connection.execute(
+            "SELECT workouts.timestamp, sets.weight * ? AS weight, sets.reps, sets.rpe FROM sets "
+            "JOIN workouts ON workouts.code = sets.workout "
+            "WHERE sets.exercise = ? AND sets.weight IS NOT NULL AND sets.reps IS NOT NULL "
+            "ORDER BY sets.time, sets.rowid",
+            (LBS_PER_KG, get_exercise_code(connection, exercise_id)),
+        ).fetchall()
+    return to_records(rows)
+
+def get_exercise(exercise_id, path=STORE_PATH):
+    """Returns the name and tag of an exercise, or None if it is unknown."""
+    with closing(connect(path)) as connection:
+        row = connection.execute(
+            "SELECT exercise_codes.id, exercises.name, tag_codes.id AS tag FROM exercises "
+            "JOIN exercise_codes ON exercise_codes.code = exercises.code "
+            "LEFT JOIN tag_codes ON tag_codes.code = exercises.tag "
+            "WHERE exercise_codes.id = ?",
+            (exercise_id,),
+        ).fetchone()
+    return dict(row) if row else None
+
+def get_exercises(path=STORE_PATH):
+    """Returns the catalogue of exercises with their tag and number of logged sets, by name."""
+    with closing(connect(path)) as connection:
+        rows = connection.execute(
+            "SELECT exercise_codes.id, exercises.name, tag_codes.id AS tag, "
+            "(SELECT COUNT(*) FROM sets WHERE sets.exercise = exercises.code) AS sets FROM exercises "
+            "JOIN exercise_codes ON exercise_codes.code = exercises.code "
+            "LEFT JOIN tag_codes ON tag_codes.code = exercises.tag "
+            "ORDER BY exercises.name, exercise_codes.id"
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+def time_range_filter(column, since, until):
+    """Builds the SQL condition and parameters restricting a column to [since, until)."""
+    conditions, params = [], []
+    if since is not None:
+        conditions.append(f"{column} >= ?")
+        params.append(since)
+    if until is not None:
+        conditions.append(f"{column} < ?")
+        params.append(until)
+    return "".join(f" AND {condition}" for condition in conditions), params
+
+def get_exercise_series(exercise_id, agg="best_e1rm", since=None, until=None, factor=LBS_PER_KG,
+                        formula=DEFAULT_E1RM_FORMULA, path=STORE_PATH):
+    """
+    Returns one point per session of an exercise: best_e1rm is the set with
+    the best 1RM estimate by formula, read from session_bests along with the
+    all-time best up to that session, max_weight the heaviest set and volume
+    sums weight x reps (with the heaviest weight and total reps alongside).
+    Weights are multiplied by factor (lbs by default) and since/until are
+    epoch seconds.
+    """
+    with closing(connect(path)) as connection:
+        exercise = get_exercise_code(connection, exercise_id)
+        if agg == "best_e1rm":
+            time_filter, params = time_range_filter("session_bests.time", since, until)
+            rows = connection.execute(
+                "SELECT workouts.timestamp, e1rm * ? AS value, weight * ? AS weight, reps, pr * ? AS pr, is_pr "
+                "FROM session_bests JOIN workouts ON workouts.code = session_bests.workout "
+                f"WHERE exercise = ? AND formula = ?{time_filter} ORDER BY session_bests.time",
+                (factor, factor, factor, exercise, formula, *params),
+            ).fetchall()
+            return [{**row, "is_pr": bool(row["is_pr"])} for row in map(dict, rows)]
+        time_filter, params = time_range_filter("time", since, until)
+        rows = connection.execute(
+            "SELECT workouts.timestamp, sessions.value, sessions.weight, sessions.reps FROM ("
+            f"SELECT workout, time, {SESSION_AGGREGATIONS[agg]} FROM sets "
+            "WHERE exercise = ? AND weight IS NOT NULL AND reps > 0"
+            f"{time_filter} GROUP BY time"
+            ") AS sessions JOIN workouts ON workouts.code = sessions.workout ORDER BY sessions.time",
+            (factor, factor, exercise, *params),
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+def get_exercise_records(exercise_id, formula=DEFAULT_E1RM_FORMULA, factor=LBS_PER_KG, path=STORE_PATH):
+    """
+    Returns the records of an exercise: the sessions that set an all-time
+    best 1RM estimate by formula, and for each of REP_MAX_REPS the sessions
+    that set a new heaviest weight for at least that many reps. The last
+    entry of each list is the current record.
+    """
+    with closing(connect(path)) as connection:
+        exercise = get_exercise_code(connection, exercise_id)
+        prs = connection.execute(
+            "SELECT workouts.timestamp, e1rm * ? AS e1rm, weight * ? AS weight, reps "
+            "FROM session_bests JOIN workouts ON workouts.code = session_bests.workout "
+            "WHERE exercise = ? AND formula = ? AND is_pr ORDER BY session_bests.time",
+            (factor, factor, exercise, formula),
+        ).fetchall()
+        rep_maxes = connection.execute(
+            "SELECT rep_maxes.reps, workouts.timestamp, weight * ? AS weight "
+            "FROM rep_maxes JOIN workouts ON workouts.code = rep_maxes.workout "
+            "WHERE exercise = ? ORDER BY rep_maxes.reps, rep_maxes.time",
+            (factor, exercise),
+        ).fetchall()
+    records = {str(reps): [] for reps in REP_MAX_REPS}
+    for row in rep_maxes:
+        records.setdefault(str(row["reps"]), []).append({"timestamp": row["timestamp"], "weight": row["weight"]})
+    return {"prs": [dict(row) for row in prs], "rep_maxes": records}
+
+# Columns of the sets streamed by iter_sets, in order
+EXPORT_COLUMNS = (
+    "workout_id", "timestamp", "exercise_id", "exercise", "tag", "weight", "reps", "rpe", "is_warmup", "is_hidden",
+)
+
+def iter_sets(exercise_ids=None, tags=None, since=None, until=None, factor=LBS_PER_KG, path=STORE_PATH):
+    """
+    Yields every set as a dictionary of EXPORT_COLUMNS, warm-up and hidden
+    ones included, optionally restricted to some exercise UUIDs and tags.
+    Weights are multiplied by factor (lbs by default) and since/until are
+    epoch seconds. Rows come straight from the cursor in chronological
+    order, walking the week index so no sort of the whole table is needed
+    before the first row, and the connection stays open until the caller
+    is done with them.
+    """
+    time_filter, params = time_range_filter("sets.time", since, until)
+    # A set falls in the week closing on the first Sunday on or after its day,
+    # these bounds let the week index seek to the start of the range
+    week_filter, week_params = time_range_filter(
+        "sets.week", since and since // 86400, until and (until - 1) // 86400 + 7,
+    )
+    filters = ""
+    if exercise_ids:
+        filters += f" AND exercise_codes.id IN ({', '.join('?' * len(exercise_ids))})"
+    if tags:
+        filters += f" AND tag_codes.id IN ({', '.join('?' * len(tags))})"
+    params = [factor, *(exercise_ids or ()), *(tags or ()), *params, *week_params]
+    with closing(connect(path)) as connection:
+        rows = connection.execute(
+            "SELECT workouts.id AS workout_id, workouts.timestamp, exercise_codes.id AS exercise_id, "
+            "exercises.name AS exercise, tag_codes.id AS tag, sets.weight * ? AS weight, sets.reps, sets.rpe, "
+            "sets.is_warmup, sets.is_hidden FROM sets "
+            "JOIN workouts ON workouts.code = sets.workout "
+            "JOIN exercise_codes ON exercise_codes.code = sets.exercise "
+            "LEFT JOIN exercises ON exercises.code = sets.exercise "
+            "LEFT JOIN tag_codes ON tag_codes.code = sets.tag "
+            f"WHERE 1{filters}{time_filter}{week_filter} ORDER BY sets.week, sets.time, sets.rowid",
+            params,
+        )
+        for row in rows:
+            yield {**row, "is_warmup": bool(row["is_warmup"]), "is_hidden": bool(row["is_hidden"])}
+
+def get_weekly_volume(since=None, until=None, tags=None, path=STORE_PATH):
+    """
+    Returns the working sets per muscle group for every week between the
+    first and last trained week, with 0 for muscle groups not trained, read
+    from the weekly_volume rollup.
+    Weeks are labelled by their closing Sunday and stored as epoch days, so
+    since/until are epoch days compared against that label.
+    """
+    time_filter, params = time_range_filter("weekly_volume.week", since, until)
+    tag_filter = ""
+    if tags:
+        tag_filter = f" AND tag_codes.id IN ({', '.join('?' * len(tags))})"
+        params = [*tags, *params]
+    with closing(connect(path)) as connection:
+        rows = connection.execute(
+            "SELECT tag_codes.id AS tag, weekly_volume.week, weekly_volume.sets FROM weekly_volume "
+            f"JOIN tag_codes ON tag_codes.code = weekly_volume.tag WHERE 1{tag_filter}{time_filter}",
+            params,
+        ).fetchall()
+    if not rows:
+        return []
+
+    tags = sorted({row["tag"] for row in rows})
+    counts = {(row["week"], row["tag"]): row["sets"] for row in rows}
+    weekly_volume = []
+    for week in range(min(row["week"] for row in rows), max(row["week"] for row in rows) + 1, 7):
+        weekly_volume.append({
+            "timestamp": f"{epoch_day_label(week)} 00:00:00+00:00",
+            **{tag: counts.get((week, tag), 0) for tag in tags},
+        })
+    return weekly_volume
+
+def get_bodyweight(since=None, until=None, factor=LBS_PER_KG, path=STORE_PATH):
+    """Returns the bodyweight entries (in lbs by default), in chronological order. since/until are epoch seconds."""
+    time_filter, params = time_range_filter("time", since, until)
+    with closing(connect(path)) as connection:
+        rows = connection.execute(
+            "SELECT timestamp, value * ? AS weight FROM body_measurements "
+            f"WHERE type = 'WEIGHT'{time_filter} ORDER BY time, rowid",
+            (factor, *params),
+        ).fetchall()
+    return to_records(rows)
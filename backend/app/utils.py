@@ -1,10 +1,134 @@
 import csv
+import fcntl
+import gzip
+import io
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+from flask import Response
+from app.constants import EXPORT_CHUNK_ROWS
+from app.metrics import STAGE_SECONDS
 
-def read_csv(file_path):
-    """Reads a CSV file and returns it as a list of dictionaries."""
+try:
+    import orjson
+except ImportError:  # Falls back to the standard library serializer
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional, gzip is always available
+    brotli = None
+
+# Responses smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 1024
+
+@contextmanager
+def atomic_write(path, mode="w"):
+    """
+    Writes to a temporary file next to path and renames it over path once
+    the block succeeds, so readers only ever see a complete file.
+    """
+    directory, name = os.path.split(path)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=directory)
     try:
-        with open(file_path, "r") as file:
-            reader = csv.DictReader(file)
-            return list(reader)
-    except FileNotFoundError:
-        return None  # Return None if file is missing
\ No newline at end of file
+        with os.fdopen(fd, mode) as file:
+            yield file
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+@contextmanager
+def file_lock(path, blocking=True):
+    """
+    Holds an exclusive lock on path + ".lock", shared by every process on
+    the host. With blocking=False, yields False instead of waiting when
+    another process holds the lock.
+    """
+    with open(f"{path}.lock", "a") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def dumps(data):
+    """Serializes data to compact JSON bytes, using orjson when it is installed."""
+    if orjson:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(",", ":")).encode()
+
+def serialize(data):
+    """Serializes data to JSON bytes, timing it as the serialize stage."""
+    with STAGE_SECONDS.labels("serialize").time():
+        return dumps(data)
+
+def json_response(data, status=200):
+    """Builds a JSON response with the fast serializer instead of jsonify, bytes are sent as already serialized."""
+    body = data if isinstance(data, bytes) else serialize(data)
+    return Response(body, status=status, mimetype="application/json")
+
+def iter_ndjson(rows, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Encodes rows as newline-delimited JSON, yielding the bytes of chunk_rows rows at a time."""
+    chunk = []
+    for row in rows:
+        chunk.append(dumps(row))
+        if len(chunk) == chunk_rows:
+            yield b"\n".join(chunk) + b"\n"
+            chunk = []
+    if chunk:
+        yield b"\n".join(chunk) + b"\n"
+
+def iter_csv(rows, fieldnames, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Encodes rows as CSV with a header line, sent on its own, then the bytes of chunk_rows rows at a time."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames)
+    writer.writeheader()
+    for count, row in enumerate(rows):
+        if count % chunk_rows == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+        writer.writerow(row)
+    yield buffer.getvalue().encode()
+
+def choose_encoding(accept_encodings):
+    """Returns the content encoding a response to the client is compressed with, brotli first, or None."""
+    if brotli and accept_encodings["br"]:
+        return "br"
+    if accept_encodings["gzip"]:
+        return "gzip"
+    return None
+
+def encode_body(body, encoding):
+    """Compresses a response body with a content encoding returned by choose_encoding."""
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+def compress_response(response, accept_encodings):
+    """Compresses a response body with brotli or gzip when the client accepts it."""
+    if (
+        response.direct_passthrough
+        or response.status_code != 200
+        or "Content-Encoding" in response.headers
+    ):
+        return response
+    response.vary.add("Accept-Encoding")
+    body = response.get_data()
+    if len(body) < MIN_COMPRESS_SIZE:
+        return response
+
+    encoding = choose_encoding(accept_encodings)
+    if encoding:
+        response.set_data(encode_body(body, encoding))
+        response.headers["Content-Encoding"] = encoding
+    return response
@@ -0,0 +1,97 @@
+import gc
+import threading
+import time
+from collections import OrderedDict
+from app.accounts import get_accounts
+from app.cache import snapshot_version
+from app.constants import CACHE_WARM_ACCOUNTS, CACHE_WARM_INTERVAL_SECONDS, DEFAULT_ACCOUNT, TRACKED_EXERCISES
+from app.logger import logger
+from app.metrics import WARMUP_ENVIRON_KEY
+
+# Requests of a dashboard load answered from the worker's cache
+WARM_PATHS = [
+    "/fetch_data",
+    "/exercises",
+    *(f"/exercises/{exercise_id}/series" for exercise_id in TRACKED_EXERCISES.values()),
+]
+
+def warm_account(client, account):
+    """Sends the dashboard's requests for an account through the app, filling this worker's cache."""
+    prefix = "" if account.name == DEFAULT_ACCOUNT else f"/accounts/{account.name}"
+    for path in WARM_PATHS:
+        client.get(f"{prefix}{path}", environ_base={WARMUP_ENVIRON_KEY: True})
+
+# Snapshot versions of the accounts whose cache was warmed by preload(),
+# inherited by the workers forked from the gunicorn master afterwards
+_preloaded = {}
+
+# Names of the accounts this process served most recently, in least recently
+# served order. Only they are kept warm, so warming never evicts what the
+# worker actually serves however many accounts there are.
+_served = OrderedDict()
+_served_lock = threading.Lock()
+
+def mark_served(name):
+    """Records a request for the data of an account, keeping the CACHE_WARM_ACCOUNTS most recent."""
+    with _served_lock:
+        _served[name] = None
+        _served.move_to_end(name)
+        while len(_served) > CACHE_WARM_ACCOUNTS:
+            _served.popitem(last=False)
+
+def recently_served():
+    """Returns the accounts this process served most recently."""
+    accounts = get_accounts()
+    with _served_lock:
+        return [accounts[name] for name in _served if name in accounts]
+
+def warm_changed(client, versions, accounts):
+    """Warms the cache with the data of the accounts whose snapshot changed since their version in versions."""
+    for account in accounts:
+        version = snapshot_version(account.json_path)
+        # Missing snapshots are left to the first request, which fetches them
+        if version is None or versions.get(account.name) == version:
+            continue
+        started = time.monotonic()
+        try:
+            warm_account(client, account)
+            logger.info(f"🔥 Warmed cache of account {account.name} in {time.monotonic() - started:.2f}s")
+        except Exception as e:
+            logger.warning(f"⚠️ Warming cache of account {account.name} failed: {e}")
+        versions[account.name] = version
+
+def watch_snapshots(app, interval):
+    """Warms the cache with the data of the recently served accounts whenever their snapshot changes, forever."""
+    client = app.test_client()
+    versions = dict(_preloaded)
+    while True:
+        accounts = recently_served()
+        # Accounts no longer served are warmed in full again if they come back
+        for name in versions.keys() - {account.name for account in accounts}:
+            del versions[name]
+        warm_changed(client, versions, accounts)
+        time.sleep(interval)
+
+def preload(app):
+    """
+    Loads everything the workers read into the gunicorn master before it
+    forks them, so they share it copy-on-write instead of each building a
+    copy: the modules building stores, the up to date store and the cached
+    dashboard data of the first CACHE_WARM_ACCOUNTS accounts with a snapshot.
+    The workers keep these warm until they serve others.
+    """
+    started = time.monotonic()
+    accounts = [account for account in get_accounts().values() if snapshot_version(account.json_path)]
+    warm_changed(app.test_client(), _preloaded, accounts[:CACHE_WARM_ACCOUNTS])
+    for name in _preloaded:
+        mark_served(name)
+    # Keeps the garbage collector of the workers off the objects loaded so
+    # far, its bookkeeping writes would copy the pages holding them
+    gc.freeze()
+    logger.info(f"📦 Preloaded {len(_preloaded)} accounts in {time.monotonic() - started:.2f}s")
+
+def start_cache_warmer(app, interval=CACHE_WARM_INTERVAL_SECONDS):
+    """Starts warming this process's cache in a background thread, called once per gunicorn worker."""
+    thread = threading.Thread(target=watch_snapshots, args=(app, interval), name="cache-warmer", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,124 @@
+"""
+Generates synthetic Strong exports shaped like the snapshots the backend
+syncs: `_embedded.log` workouts made of cell set groups, the `measurement`
+catalogue and `measuredValue` bodyweight entries.
+
+    python -m bench.generate --years 5 --workouts-per-week 4 data.json.gz
+"""
+import argparse
+import json
+import os
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+from app.constants import BASE_DIR, TRACKED_EXERCISES
+from app.snapshot import write_snapshot
+
+EXERCISES_PATH = os.path.join(BASE_DIR, "data", "exercises.json")
+START_DATE = datetime(2018, 1, 1, 6, tzinfo=timezone.utc)
+
+def format_date(moment):
+    return moment.isoformat().replace("+00:00", "Z")
+
+def generate_measurements(exercises, rng):
+    """Returns the exercise catalogue, the real one first then custom exercises to reach the requested size."""
+    with open(EXERCISES_PATH, "r") as file:
+        catalogue = list(json.load(file).items())
+    # The dashboard's lifts come first, so every catalogue size includes them
+    tracked = set(TRACKED_EXERCISES.values())
+    catalogue.sort(key=lambda entry: entry[0] not in tracked)
+    tags = sorted({exercise["tag"] for _, exercise in catalogue if exercise["tag"]})
+    for index in range(len(catalogue), exercises):
+        catalogue.append((str(uuid.UUID(int=rng.getrandbits(128))), {"tag": rng.choice(tags), "name": f"Custom {index}"}))
+    measurements = []
+    for id, exercise in catalogue[:max(exercises, len(TRACKED_EXERCISES))]:
+        name = {"custom": exercise["name"]} if exercise["name"].startswith("Custom") else {"en": exercise["name"]}
+        links = {"tag": [{"href": f"/api/tags/{exercise['tag']}"}]} if exercise["tag"] else {}
+        measurements.append({"id": id, "name": name, "_links": links})
+    return measurements
+
+def generate_workout(moment, exercise_ids, sets, hidden_ratio, warmup_ratio, rng):
+    """Returns one workout log, with the tracked lifts trained more often than the rest."""
+    lifts = rng.sample(list(TRACKED_EXERCISES.values()), 2) + rng.sample(exercise_ids, min(3, len(exercise_ids)))
+    groups = []
+    for exercise_id in lifts:
+        base = rng.uniform(40, 140)
+        cell_sets = []
+        for index in range(sets):
+            cells = [
+                {"cellType": "BARBELL_WEIGHT", "value": f"{base + rng.randint(-3, 3) * 2.5:.1f}"},
+                {"cellType": "REPS", "value": str(rng.randint(1, 12))},
+                {"cellType": "RPE", "value": str(rng.randint(6, 10))} if index % 2 else {"cellType": "RPE"},
+            ]
+            cell_set = {"cells": cells}
+            if rng.random() < warmup_ratio:
+                cell_set["cellSetTag"] = "WARM_UP"
+            if rng.random() < hidden_ratio:
+                cell_set["isHidden"] = True
+            cell_sets.append(cell_set)
+        groups.append({"_links": {"measurement": {"href": f"/api/measurements/{exercise_id}"}}, "cellSets": cell_sets})
+    # The app keeps an empty group for the exercise being picked
+    groups.append({"_links": {}, "cellSets": []})
+    return {
+        "id": str(uuid.UUID(int=rng.getrandbits(128))),
+        "logType": "WORKOUT",
+        "isHidden": rng.random() < hidden_ratio,
+        "startDate": format_date(moment),
+        "_embedded": {"cellSetGroup": groups},
+    }
+
+def generate_export(years=1, workouts_per_week=4, exercises=100, sets=4, hidden_ratio=0.02, warmup_ratio=0.25, seed=0):
+    """
+    Returns a Strong export covering years of training, with the given
+    number of workouts per week, exercises in the catalogue and sets per
+    exercise. hidden_ratio and warmup_ratio are the share of hidden workouts
+    and sets, and of warm-up sets.
+    """
+    rng = random.Random(seed)
+    measurements = generate_measurements(exercises, rng)
+    exercise_ids = [measurement["id"] for measurement in measurements]
+    logs, measured_values = [], []
+    for week in range(years * 52):
+        for day in sorted(rng.sample(range(7), min(workouts_per_week, 7))):
+            moment = START_DATE + timedelta(weeks=week, days=day, minutes=rng.randint(0, 12 * 60))
+            logs.append(generate_workout(moment, exercise_ids, sets, hidden_ratio, warmup_ratio, rng))
+        measured_values.append({
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "measurementTypeValue": "WEIGHT",
+            "startDate": format_date(START_DATE + timedelta(weeks=week)),
+            "value": round(80 + rng.uniform(-2, 2) + week * 0.01, 2),
+            "isHidden": rng.random() < hidden_ratio,
+        })
+    return {
+        "_links": {"self": {"href": "/api/users/bench"}},
+        "_embedded": {"log": logs, "measurement": measurements, "measuredValue": measured_values},
+    }
+
+def write_export(export, path):
+    """Writes an export as a compressed snapshot, or as plain JSON when path does not end with .gz."""
+    if path.endswith(".gz"):
+        with write_snapshot(path) as file:
+            json.dump(export, file)
+    else:
+        with open(path, "w") as file:
+            json.dump(export, file)
+
+def main():
+    parser = argparse.ArgumentParser(description="Generates a synthetic Strong export.")
+    parser.add_argument("path", help="where to write the export, compressed when it ends with .gz")
+    parser.add_argument("--years", type=int, default=1)
+    parser.add_argument("--workouts-per-week", type=int, default=4)
+    parser.add_argument("--exercises", type=int, default=100)
+    parser.add_argument("--sets", type=int, default=4, help="sets per exercise of a workout")
+    parser.add_argument("--hidden-ratio", type=float, default=0.02)
+    parser.add_argument("--warmup-ratio", type=float, default=0.25)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    export = generate_export(
+        args.years, args.workouts_per_week, args.exercises, args.sets, args.hidden_ratio, args.warmup_ratio, args.seed,
+    )
+    write_export(export, args.path)
+    print(f"Wrote {len(export['_embedded']['log'])} workouts to {args.path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Benchmarks every stage between a synced snapshot and the dashboard's
+requests on synthetic exports of growing size, reporting the median latency,
+throughput and peak Python memory (tracemalloc, SQLite's own memory is not
+counted) of each stage.
+
+    python -m bench.run --years 1 5 10 --repeat 3 --json results.json
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import statistics
+import time
+import tracemalloc
+from app import create_app
+from app.accounts import Account, get_accounts
+from app.cache import invalidate
+from app.constants import BENCH_PRESS_ID
+from app.extractor import load_json_data_local, main as build_store
+from bench.generate import generate_export, write_export
+
+BENCH_ACCOUNT = "bench"
+
+def measure(run, setup=None, repeat=3):
+    """Returns the median seconds of run over repeat runs and its peak memory in bytes, calling setup before each run."""
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    # Tracing slows allocations down, so memory is measured on a run of its own
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return statistics.median(timings), peak
+
+def count_items(account):
+    with open(account.json_path, "rb") as file:
+        return sum(1 for _ in load_json_data_local(file))
+
+def benchmark_size(account, client, export, repeat):
+    """Runs every stage on one export and returns {stage: result}."""
+    logs = export["_embedded"]["log"]
+    sets = sum(len(group["cellSets"]) for log in logs for group in log["_embedded"]["cellSetGroup"])
+    items = sum(len(items) for items in export["_embedded"].values())
+    prefix = f"/accounts/{account.name}"
+
+    def remove_store():
+        if os.path.exists(account.store_path):
+            os.remove(account.store_path)
+
+    def get(path, headers=None):
+        def run():
+            response = client.get(f"{prefix}{path}", headers=headers)
+            assert response.status_code in (200, 304), f"{path} answered {response.status_code}"
+            # Streamed bodies are only produced as they are read
+            response.get_data()
+        return run
+
+    conditional = {}
+
+    def revalidate():
+        # The client holds the ETag of the current snapshot
+        conditional["If-None-Match"] = client.get(f"{prefix}/fetch_data").headers["ETag"]
+
+    write_export(export, account.json_path)
+    build_store(account)
+    stages = [
+        ("snapshot_write", "workouts", len(logs), lambda: write_export(export, account.json_path), None),
+        ("snapshot_read", "items", items, lambda: count_items(account), None),
+        ("store_build", "sets", sets, lambda: build_store(account), remove_store),
+        ("fetch_data_cold", "requests", 1, get("/fetch_data"), lambda: invalidate(account.name)),
+        ("fetch_data_cached", "requests", 1, get("/fetch_data"), None),
+        ("fetch_data_304", "requests", 1, get("/fetch_data", conditional), revalidate),
+        ("series_cold", "requests", 1, get(f"/exercises/{BENCH_PRESS_ID}/series"), lambda: invalidate(account.name)),
+        ("records", "requests", 1, get(f"/exercises/{BENCH_PRESS_ID}/records"), lambda: invalidate(account.name)),
+        ("weekly_volume", "requests", 1, get("/volume/weekly"), None),
+        ("bodyweight", "requests", 1, get("/bodyweight"), None),
+        ("export_ndjson", "sets", sets, get("/export"), None),
+        ("export_csv", "sets", sets, get("/export?format=csv"), None),
+    ]
+    results = {}
+    for name, unit, units, run, setup in stages:
+        seconds, peak = measure(run, setup, repeat)
+        results[name] = {
+            "seconds": round(seconds, 6),
+            "throughput": round(units / seconds, 1) if seconds else None,
+            "unit": f"{unit}/s",
+            "peak_mib": round(peak / 2**20, 2),
+        }
+    return {"workouts": len(logs), "sets": sets, "items": items, "stages": results}
+
+def print_results(label, result):
+    print(f"\n{label}: {result['workouts']} workouts, {result['sets']} sets, {result['items']} items")
+    print(f"{'stage':<20}{'median ms':>12}{'throughput':>16}  {'unit':<12}{'peak MiB':>10}")
+    for name, stage in result["stages"].items():
+        print(f"{name:<20}{stage['seconds'] * 1000:>12.2f}{stage['throughput']:>16,.1f}  {stage['unit']:<12}{stage['peak_mib']:>10.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the backend on synthetic Strong exports.")
+    parser.add_argument("--years", type=int, nargs="+", default=[1, 5, 10], help="history lengths to benchmark")
+    parser.add_argument("--workouts-per-week", type=int, default=4)
+    parser.add_argument("--exercises", type=int, default=100)
+    parser.add_argument("--sets", type=int, default=4, help="sets per exercise of a workout")
+    parser.add_argument("--hidden-ratio", type=float, default=0.02)
+    parser.add_argument("--warmup-ratio", type=float, default=0.25)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    # The benchmarks run against an account of their own, removed afterwards
+    if BENCH_ACCOUNT in get_accounts():
+        parser.error(f"an account named {BENCH_ACCOUNT} is configured, its data would be overwritten")
+    account = Account(BENCH_ACCOUNT, None, None)
+    get_accounts()[BENCH_ACCOUNT] = account
+    client = create_app().test_client()
+    results = {}
+    try:
+        for years in args.years:
+            export = generate_export(
+                years, args.workouts_per_week, args.exercises, args.sets, args.hidden_ratio, args.warmup_ratio,
+            )
+            results[f"{years}y"] = benchmark_size(account, client, export, args.repeat)
+            print_results(f"{years} years", results[f"{years}y"])
+    finally:
+        shutil.rmtree(account.data_dir, ignore_errors=True)
+        del get_accounts()[BENCH_ACCOUNT]
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=4)
+
+if __name__ == "__main__":
+    main()
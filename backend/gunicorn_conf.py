@@ -1,6 +1,25 @@
+import os
+import shutil
+
+# Workers write their metrics to files merged by /metrics. The variable must
+# be set before prometheus_client is imported, so before anything from app
+os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "app", "data", "metrics")
+)
+
+# The master loads the app and the data of every account once, before forking
+# the workers which share them (see app.warmup.preload). Set PRELOAD_APP=false
+# to have every worker load its own copy instead
+preload_app = os.environ.get("PRELOAD_APP", "true").lower() == "true"
+
 def on_starting(server):
+    # Samples left by a previous run would be merged into this one's
+    metrics_dir = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir)
+
     from flask_apscheduler import APScheduler
-    from app.api import get_data  # Import your data fetch function
+    from app.scheduler import run_scheduled_refresh
     from wsgi import app
     from app.logger import logger
 
@@ -16,8 +35,28 @@ def on_starting(server):
     @scheduler.task('cron', id='fetch_data_job', hour=0, minute=0)  # Runs daily at midnight
     def fetch_data_job():
         logger.info("🔄 Running scheduled data fetch...")
-        result = get_data()
-        logger.info(f"✅ Data fetch result: {result}")
+        result = run_scheduled_refresh()
+        if result is not None:
+            logger.info(f"✅ Data fetch result: {result}")
 
     scheduler.start()
     logger.info("✅ Scheduler started in Gunicorn master process with scheduled tasks.")
+
+def when_ready(server):
+    # Runs after the scheduler has registered its routes, the app must not serve requests before
+    if server.cfg.preload_app:
+        from app.warmup import preload
+        from wsgi import app
+
+        preload(app)
+
+def post_worker_init(worker):
+    from app.warmup import start_cache_warmer
+
+    # Each worker fills its own cache whenever a snapshot changes, before any request needs it
+    start_cache_warmer(worker.wsgi)
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
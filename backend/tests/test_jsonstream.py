@@ -0,0 +1,58 @@
+import functools
+import io
+import json
+import pytest
+from app import jsonstream
+from app.jsonstream import JSONStreamReader, iter_embedded
+
+DOCUMENT = {
+    "_links": {"next": {"href": "/api/users/1/logs?continuation=300"}},
+    "_embedded": {
+        "log": [
+            {"id": "a", "name": "Push \"day\" \\ é漢", "sets": [1, -2.5e3, True, False, None], "empty": {}},
+            {"id": "b", "nested": {"deep": [[], [{}], {"x": [1, {"y": "}]"}]}]}},
+            {"id": "c", "value": 12345678901234567890},
+        ],
+        "measurement": [{"id": "m", "tag": None}],
+        "tag": [],
+        "count": 3,
+    },
+    "total": 0.5,
+}
+
+@pytest.fixture
+def stream(monkeypatch):
+    """Streams DOCUMENT through iter_embedded, reading chunk_size characters at a time."""
+    def run(chunk_size, indent=1, **kwargs):
+        monkeypatch.setattr(jsonstream, "JSONStreamReader", functools.partial(JSONStreamReader, chunk_size=chunk_size))
+        return list(iter_embedded(io.StringIO(json.dumps(DOCUMENT, indent=indent, ensure_ascii=False)), **kwargs))
+    return run
+
+@pytest.mark.parametrize("indent", [None, 1])
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 4, 5, 6, 7, 64 * 1024])
+def test_items_survive_chunk_boundaries(stream, chunk_size, indent):
+    # Small chunks split every token of the document, strings and escapes included
+    expected = [
+        ("_links", DOCUMENT["_links"]),
+        *(("log", item) for item in DOCUMENT["_embedded"]["log"]),
+        ("measurement", DOCUMENT["_embedded"]["measurement"][0]),
+    ]
+    assert stream(chunk_size, indent, keys=("_links",)) == expected
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7])
+def test_raw_text_decodes_to_the_item(stream, chunk_size):
+    triples = stream(chunk_size, resources={"log"}, raw=True)
+    assert [item for _, item, _ in triples] == DOCUMENT["_embedded"]["log"]
+    assert all(json.loads(text) == item for _, item, text in triples)
+
+def test_only_requested_resources_are_yielded(stream):
+    assert stream(5, resources={"measurement", "tag"}) == [("measurement", {"id": "m", "tag": None})]
+
+def test_scalar_at_end_of_stream():
+    reader = JSONStreamReader(io.StringIO("[1,22,333]"), chunk_size=1)
+    assert list(reader.iter_array()) == [1, 22, 333]
+
+def test_truncated_document_raises():
+    text = json.dumps(DOCUMENT)[:-20]
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_embedded(io.StringIO(text)))
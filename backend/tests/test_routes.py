@@ -0,0 +1,91 @@
+import gzip
+from datetime import timedelta
+from email.utils import format_datetime
+import pytest
+from app import accounts, create_app, routes
+from app.accounts import Account
+from app.cache import invalidate, snapshot_last_modified
+from app.metrics import WARMUP_ENVIRON_KEY
+from app.utils import MIN_COMPRESS_SIZE
+from bench.generate import generate_export, write_export
+
+@pytest.fixture
+def account(tmp_path, monkeypatch):
+    monkeypatch.setattr(accounts, "ACCOUNTS_DIR", str(tmp_path))
+    account = Account("routes-test", None, None)
+    monkeypatch.setattr(accounts, "_accounts", {account.name: account})
+    write_export(generate_export(years=1, exercises=10), account.json_path)
+    invalidate()
+    yield account
+    invalidate()
+
+@pytest.fixture
+def client(account):
+    return create_app().test_client()
+
+def test_etag_round_trip_answers_304_before_any_work(client, account, monkeypatch):
+    response = client.get("/accounts/routes-test/fetch_data")
+    assert response.status_code == 200
+    etag, weak = response.get_etag()
+    assert weak and response.cache_control.no_cache
+
+    # Revalidation must not touch the cache or the store
+    invalidate()
+    monkeypatch.setattr(routes, "get_cached", pytest.fail)
+    revalidated = client.get("/accounts/routes-test/fetch_data", headers={"If-None-Match": f'W/"{etag}"'})
+    assert revalidated.status_code == 304
+    assert revalidated.get_etag() == (etag, True)
+    assert revalidated.data == b""
+    # Strong comparison of If-None-Match would never match a weak ETag, the check is weak
+    assert client.get("/accounts/routes-test/fetch_data", headers={"If-None-Match": f'"{etag}"'}).status_code == 304
+
+def test_last_modified_round_trip_truncates_to_seconds(client, account):
+    response = client.get("/accounts/routes-test/fetch_data")
+    last_modified = response.headers["Last-Modified"]
+    # The header has no sub-second part while the snapshot mtime usually has one
+    assert response.last_modified == snapshot_last_modified(account.json_path).replace(microsecond=0)
+    assert client.get(
+        "/accounts/routes-test/fetch_data", headers={"If-Modified-Since": last_modified}
+    ).status_code == 304
+    earlier = format_datetime(response.last_modified - timedelta(seconds=1), usegmt=True)
+    assert client.get(
+        "/accounts/routes-test/fetch_data", headers={"If-Modified-Since": earlier}
+    ).status_code == 200
+
+def test_fetch_data_is_gzipped_once_per_snapshot(client, monkeypatch):
+    plain = client.get("/accounts/routes-test/fetch_data")
+    assert "Content-Encoding" not in plain.headers
+
+    encoded = []
+    encode_body = routes.encode_body
+    monkeypatch.setattr(routes, "encode_body", lambda body, encoding: encoded.append(encoding) or encode_body(body, encoding))
+    for _ in range(3):
+        response = client.get("/accounts/routes-test/fetch_data", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert "Accept-Encoding" in response.vary
+        assert gzip.decompress(response.data) == plain.data
+    assert encoded == ["gzip"]
+
+def test_other_responses_are_compressed_when_accepted(client):
+    plain = client.get("/accounts/routes-test/volume/weekly")
+    assert len(plain.data) >= MIN_COMPRESS_SIZE
+    response = client.get("/accounts/routes-test/volume/weekly", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(response.data) == plain.data
+
+def test_warm_up_responses_are_not_compressed(client):
+    response = client.get(
+        "/accounts/routes-test/volume/weekly", headers={"Accept-Encoding": "gzip"}, environ_base={WARMUP_ENVIRON_KEY: True}
+    )
+    assert response.status_code == 200
+    assert len(response.data) >= MIN_COMPRESS_SIZE
+    assert "Content-Encoding" not in response.headers
+
+def test_export_is_streamed_uncompressed(client):
+    response = client.get("/accounts/routes-test/export", headers={"Accept-Encoding": "gzip"}, buffered=False)
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert "Content-Encoding" not in response.headers
+    first_line = next(response.response)
+    assert first_line.startswith(b"{")
+    response.close()
@@ -0,0 +1,49 @@
+import json
+import time
+import pytest
+from app import scheduler
+from app.scheduler import acquire_lease, read_lease
+
+@pytest.fixture
+def lease_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(scheduler, "LEASE_SETTLE_SECONDS", 0)
+    return str(tmp_path / "scheduler_lease.json")
+
+@pytest.fixture
+def node(monkeypatch):
+    """Switches the host the scheduler runs on, so one test can play several owners."""
+    def switch(name):
+        monkeypatch.setattr(scheduler.socket, "gethostname", lambda: name)
+    switch("node-a")
+    return switch
+
+def write_lease(path, lease):
+    with open(path, "w") as file:
+        file.write(lease if isinstance(lease, str) else json.dumps(lease))
+
+def test_a_live_lease_is_kept_by_its_owner(lease_path, node):
+    assert acquire_lease(lease_path, ttl=60)
+    node("node-b")
+    assert not acquire_lease(lease_path, ttl=60)
+    assert read_lease(lease_path)["owner"].startswith("node-a:")
+    # The owner firing again for the same run renews its lease
+    node("node-a")
+    assert acquire_lease(lease_path, ttl=60)
+
+def test_an_expired_lease_is_taken_over(lease_path, node):
+    write_lease(lease_path, {"owner": "node-b:1", "expires_at": time.time() - 1})
+    assert acquire_lease(lease_path, ttl=60)
+    assert read_lease(lease_path)["owner"].startswith("node-a:")
+
+@pytest.mark.parametrize("lease", ["", "{", "[]", '{"owner": "node-b:1"}', '{"owner": "node-b:1", "expires_at": "soon"}'])
+def test_an_unreadable_lease_is_taken_over(lease_path, node, lease):
+    write_lease(lease_path, lease)
+    assert read_lease(lease_path) is None
+    assert acquire_lease(lease_path, ttl=60)
+
+def test_the_last_node_writing_the_lease_wins(lease_path, node, monkeypatch):
+    # Another node, outside the file lock, writes its lease while this one settles
+    monkeypatch.setattr(scheduler.time, "sleep", lambda seconds: write_lease(
+        lease_path, {"owner": "node-b:1", "expires_at": time.time() + 60}
+    ))
+    assert not acquire_lease(lease_path, ttl=60)
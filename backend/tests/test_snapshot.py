@@ -0,0 +1,82 @@
+import gzip
+import json
+import os
+import pytest
+from app import snapshot
+from app.jsonstream import iter_embedded
+from app.snapshot import SnapshotWriter, group_by_resource, migrate_snapshot, read_snapshot, write_snapshot
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    # Sync spools are created in the data directory
+    monkeypatch.setattr(snapshot, "DATA_DIR", str(tmp_path))
+    return tmp_path
+
+def read_items(path):
+    with open(path, "rb") as file:
+        return list(iter_embedded(read_snapshot(file)))
+
+def write_items(path, embedded):
+    with write_snapshot(str(path)) as file:
+        json.dump({"_links": {}, "_embedded": embedded}, file)
+
+def test_snapshots_are_gzip_compressed_and_reproducible(tmp_path):
+    first, second = tmp_path / "first.json.gz", tmp_path / "second.json.gz"
+    write_items(first, {"log": [{"id": "a"}]})
+    write_items(second, {"log": [{"id": "a"}]})
+    assert first.read_bytes()[:2] == snapshot.GZIP_MAGIC
+    assert first.read_bytes() == second.read_bytes()
+    assert read_items(first) == [("log", {"id": "a"})]
+
+def test_migrate_compresses_a_legacy_snapshot_once(tmp_path):
+    legacy, path = tmp_path / "data.json", tmp_path / "data.json.gz"
+    legacy.write_text(json.dumps({"_embedded": {"log": [{"id": "a"}]}}))
+    migrate_snapshot(str(legacy), str(path))
+    assert not legacy.exists()
+    assert json.loads(gzip.decompress(path.read_bytes())) == {"_embedded": {"log": [{"id": "a"}]}}
+
+def test_merge_replaces_synced_items_by_id_and_keeps_the_others(data_dir):
+    path = data_dir / "data.json.gz"
+    write_items(path, {
+        "log": [{"id": "1"}, {"id": "2", "v": "old"}, {"id": "3"}],
+        "measurement": [{"id": "m"}],
+    })
+    writer = SnapshotWriter()
+    try:
+        writer.add("log", {"id": "2", "v": "new"})
+        writer.add("log", {"id": "4"}, text='{"id": "4"}')
+        writer.add("measuredValue", {"id": "w"})
+        writer.write(str(path), merge=True)
+    finally:
+        writer.close()
+    assert read_items(path) == [
+        ("log", {"id": "1"}), ("log", {"id": "3"}), ("log", {"id": "2", "v": "new"}), ("log", {"id": "4"}),
+        ("measurement", {"id": "m"}),
+        ("measuredValue", {"id": "w"}),
+    ]
+    assert not os.path.exists(writer.spool_dir)
+
+def test_write_without_merge_keeps_only_synced_items(data_dir):
+    path = data_dir / "data.json.gz"
+    write_items(path, {"log": [{"id": "1"}], "measurement": [{"id": "m"}]})
+    writer = SnapshotWriter()
+    try:
+        writer.add("log", {"id": "2"})
+        writer.write(str(path))
+    finally:
+        writer.close()
+    assert read_items(path) == [("log", {"id": "2"})]
+
+def test_group_by_resource_groups_consecutive_pairs():
+    pairs = [("log", 1), ("log", 2), ("measurement", 3), ("log", 4)]
+    assert [(resource, list(items)) for resource, items in group_by_resource(pairs)] == [
+        ("log", [1, 2]), ("measurement", [3]), ("log", [4]),
+    ]
+
+def test_group_by_resource_skips_what_the_caller_left():
+    pairs = [("log", 1), ("log", 2), ("measurement", 3)]
+    resources = []
+    for resource, items in group_by_resource(pairs):
+        resources.append((resource, next(items)))
+    assert resources == [("log", 1), ("measurement", 3)]
+    assert list(group_by_resource([])) == []
@@ -0,0 +1,199 @@
+import copy
+import sqlite3
+from collections import Counter
+from datetime import date, datetime, timedelta
+import pytest
+from app import accounts
+from app.accounts import Account
+from app.cache import snapshot_version
+from app.constants import REP_MAX_REPS
+from app.extractor import extract_exercise, extract_rows, ingest_synced_items, main
+from app.store import build_store, get_store_version
+from bench.generate import generate_export, write_export
+
+@pytest.fixture(scope="module")
+def export():
+    return generate_export(years=1, exercises=10, seed=1)
+
+@pytest.fixture(scope="module")
+def store(export, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("store") / "strong.db")
+    items = ((resource, item) for resource, items in export["_embedded"].items() for item in items)
+    build_store("test", extract_rows(items), path)
+    connection = sqlite3.connect(path)
+    yield connection
+    connection.close()
+
+def iter_sets(export):
+    """Yields (workout, exercise id, weight, reps, counted) for every set of the visible workouts, read straight from the export."""
+    for log in export["_embedded"]["log"]:
+        if log["logType"] != "WORKOUT" or log.get("isHidden"):
+            continue
+        for group in log["_embedded"]["cellSetGroup"]:
+            if "measurement" not in group["_links"]:
+                continue
+            exercise = group["_links"]["measurement"]["href"].split("/")[-1]
+            for cell_set in group["cellSets"]:
+                cells = {cell["cellType"]: cell.get("value") for cell in cell_set["cells"]}
+                counted = cell_set.get("cellSetTag") != "WARM_UP" and not cell_set.get("isHidden", False)
+                yield log, exercise, float(cells["BARBELL_WEIGHT"]), int(cells["REPS"]), counted
+
+def iter_sessions(export):
+    """Yields (exercise id, workout, sets) for every session, in chronological order per exercise."""
+    sessions = {}
+    for log, exercise, weight, reps, _ in iter_sets(export):
+        sessions.setdefault(exercise, {}).setdefault((log["startDate"], log["id"]), []).append((weight, reps))
+    for exercise, workouts in sessions.items():
+        for (_, workout), sets in sorted(workouts.items()):
+            yield exercise, workout, sets
+
+def week_of(timestamp):
+    """Returns the epoch day of the Sunday closing the week of a timestamp."""
+    day = datetime.fromisoformat(timestamp.replace("Z", "+00:00")).date()
+    return (day + timedelta(days=6 - day.weekday()) - date(1970, 1, 1)).days
+
+def test_weekly_volume_counts_the_working_sets_per_tag_and_week(export, store):
+    tags = {id: tag for id, _, tag in map(extract_exercise, export["_embedded"]["measurement"])}
+    expected = Counter(
+        (tags[exercise], week_of(log["startDate"]))
+        for log, exercise, _, _, counted in iter_sets(export)
+        if counted and tags.get(exercise)
+    )
+    rows = store.execute(
+        "SELECT tag_codes.id, week, sets FROM weekly_volume JOIN tag_codes ON tag_codes.code = weekly_volume.tag"
+    ).fetchall()
+    assert {(tag, week): sets for tag, week, sets in rows} == expected
+
+def test_session_bests_keep_the_first_best_set_and_the_running_pr(export, store):
+    expected = []
+    best = {}
+    for exercise, workout, sets in iter_sessions(export):
+        # max() keeps the first of equal sets, like the store
+        weight, reps = max((set for set in sets if set[1] > 0), key=lambda set: set[0] * (1 + set[1] / 30.0))
+        e1rm = weight * (1 + reps / 30.0)
+        previous = best.get(exercise, 0)
+        best[exercise] = max(previous, e1rm)
+        expected.append((exercise, workout, round(e1rm, 6), weight, reps, round(best[exercise], 6), int(e1rm > previous)))
+    rows = store.execute(
+        "SELECT exercise_codes.id, workouts.id, round(e1rm, 6), weight, reps, round(pr, 6), is_pr FROM session_bests "
+        "JOIN exercise_codes ON exercise_codes.code = session_bests.exercise "
+        "JOIN workouts ON workouts.code = session_bests.workout "
+        "WHERE formula = 'epley'"
+    ).fetchall()
+    assert sorted(rows) == sorted(expected)
+
+@pytest.mark.parametrize("minimum", REP_MAX_REPS)
+def test_rep_maxes_are_the_sessions_beating_the_heaviest_weight_so_far(export, store, minimum):
+    expected = []
+    heaviest = {}
+    for exercise, workout, sets in iter_sessions(export):
+        weights = [weight for weight, reps in sets if reps >= minimum and weight > 0]
+        if not weights:
+            continue
+        if exercise not in heaviest or max(weights) > heaviest[exercise]:
+            expected.append((exercise, workout, max(weights)))
+            heaviest[exercise] = max(weights)
+    rows = store.execute(
+        "SELECT exercise_codes.id, workouts.id, weight FROM rep_maxes "
+        "JOIN exercise_codes ON exercise_codes.code = rep_maxes.exercise "
+        "JOIN workouts ON workouts.code = rep_maxes.workout "
+        "WHERE reps = ?",
+        (minimum,),
+    ).fetchall()
+    assert sorted(rows) == sorted(expected)
+
+def shift(timestamp, days):
+    return (datetime.fromisoformat(timestamp.replace("Z", "+00:00")) + timedelta(days=days)).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+def synced_items(export):
+    """
+    Returns items an incremental sync could bring for an export, by kind:
+    an edited, a moved, a hidden and a new workout, a retagged exercise and
+    one with a new tag, and an edited, a hidden and a new body measurement.
+    """
+    workouts = [log for log in export["_embedded"]["log"] if not log.get("isHidden")]
+    edited, moved, hidden, new = (copy.deepcopy(workouts[index]) for index in (len(workouts) // 2, 10, 20, -1))
+    for group in edited["_embedded"]["cellSetGroup"]:
+        for cell_set in group["cellSets"]:
+            for cell in cell_set["cells"]:
+                if cell["cellType"] == "BARBELL_WEIGHT":
+                    cell["value"] = str(float(cell["value"]) * 1.5)
+    moved["startDate"] = shift(moved["startDate"], -9)
+    hidden["isHidden"] = True
+    new["id"], new["startDate"] = "new-workout", shift(new["startDate"], 7)
+
+    measurements = copy.deepcopy(export["_embedded"]["measurement"][:2])
+    measurements[0]["_links"]["tag"] = measurements[1]["_links"]["tag"]
+    measurements[1]["_links"]["tag"] = [{"href": "/api/tags/new-tag"}]
+
+    measured_values = copy.deepcopy(export["_embedded"]["measuredValue"][-2:])
+    measured_values[0]["value"] += 1
+    measured_values[1]["isHidden"] = True
+    measured_values.append({**measured_values[0], "id": "new-measurement", "startDate": shift(measured_values[0]["startDate"], 7)})
+
+    kinds = {
+        "workouts": [("log", log) for log in (edited, moved, hidden, new)],
+        "exercises": [("measurement", item) for item in measurements],
+        "measurements": [("measuredValue", item) for item in measured_values],
+    }
+    kinds["all"] = [item for items in kinds.values() for item in items]
+    return kinds
+
+def merge(export, items):
+    """Merges synced items into an export by id like the snapshot writer, replaced items moving to the end."""
+    merged = {"_embedded": {}}
+    for resource, previous in export["_embedded"].items():
+        synced = [item for key, item in items if key == resource]
+        ids = {item["id"] for item in synced}
+        merged["_embedded"][resource] = [item for item in previous if item["id"] not in ids] + synced
+    return merged
+
+# Every table of a store with the codes translated back to UUIDs, so stores numbered differently compare equal
+STORE_DUMPS = {
+    "exercises": "SELECT exercise_codes.id, name, tag_codes.id FROM exercises "
+                 "JOIN exercise_codes ON exercise_codes.code = exercises.code LEFT JOIN tag_codes ON tag_codes.code = exercises.tag",
+    "workouts": "SELECT id, timestamp, time, week FROM workouts",
+    "sets": "SELECT workouts.id, exercise_codes.id, tag_codes.id, sets.time, sets.week, weight, reps, rpe, is_warmup, is_hidden FROM sets "
+            "JOIN workouts ON workouts.code = sets.workout JOIN exercise_codes ON exercise_codes.code = sets.exercise "
+            "LEFT JOIN tag_codes ON tag_codes.code = sets.tag",
+    "weekly_volume": "SELECT tag_codes.id, week, sets FROM weekly_volume JOIN tag_codes ON tag_codes.code = weekly_volume.tag",
+    "session_bests": "SELECT exercise_codes.id, formula, session_bests.time, workouts.id, e1rm, weight, reps, pr, is_pr FROM session_bests "
+                     "JOIN exercise_codes ON exercise_codes.code = session_bests.exercise JOIN workouts ON workouts.code = session_bests.workout",
+    "rep_maxes": "SELECT exercise_codes.id, reps, rep_maxes.time, workouts.id, weight FROM rep_maxes "
+                 "JOIN exercise_codes ON exercise_codes.code = rep_maxes.exercise JOIN workouts ON workouts.code = rep_maxes.workout",
+    "body_measurements": "SELECT id, type, timestamp, time, value FROM body_measurements",
+}
+
+def dump_store(path):
+    connection = sqlite3.connect(path)
+    try:
+        return {table: Counter(connection.execute(query).fetchall()) for table, query in STORE_DUMPS.items()}
+    finally:
+        connection.close()
+
+@pytest.fixture
+def account(tmp_path, monkeypatch):
+    monkeypatch.setattr(accounts, "ACCOUNTS_DIR", str(tmp_path))
+    return Account("store-test", None, None)
+
+@pytest.mark.parametrize("kind", ["workouts", "exercises", "measurements", "all"])
+def test_synced_items_update_the_store_like_a_rebuild(export, account, tmp_path, kind):
+    write_export(export, account.json_path)
+    main(account)
+    base_version = snapshot_version(account.json_path)
+    items = synced_items(export)[kind]
+    merged = merge(export, items)
+    write_export(merged, account.json_path)
+
+    assert ingest_synced_items(account, base_version, items)
+    assert get_store_version(account.store_path) == snapshot_version(account.json_path)
+    rebuilt = str(tmp_path / "rebuilt.db")
+    build_store("rebuilt", extract_rows((resource, item) for resource, items in merged["_embedded"].items() for item in items), rebuilt)
+    assert dump_store(account.store_path) == dump_store(rebuilt)
+
+def test_store_behind_the_snapshot_is_left_to_a_rebuild(export, account):
+    write_export(export, account.json_path)
+    main(account)
+    version = get_store_version(account.store_path)
+    assert not ingest_synced_items(account, "another-version", synced_items(export)["all"])
+    assert get_store_version(account.store_path) == version
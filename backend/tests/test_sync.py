@@ -0,0 +1,187 @@
+import importlib
+import json
+import os
+import signal
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import pytest
+from app import accounts, snapshot
+from app.accounts import Account
+from app.jsonstream import iter_embedded
+from app.snapshot import read_snapshot
+from app.utils import atomic_write, file_lock
+
+# The package exports the api blueprint under the same name as the module
+api = importlib.import_module("app.api")
+
+class FakeStrong(ThreadingHTTPServer):
+    """Serves the login and the continuation pages of each resource from pages, recording the requests."""
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeStrongHandler)
+        self.pages = {}
+        self.requests = []
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+class FakeStrongHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.reply({"accessToken": "token", "userId": "user"})
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query, keep_blank_values=True)
+        resource, continuation = query["include"][0], query["continuation"][0]
+        self.server.requests.append((resource, continuation))
+        pages = self.server.pages[resource]
+        index = int(continuation or 0)
+        links = {}
+        if index + 1 < len(pages):
+            links["next"] = {"href": f"/api/users/user/?continuation={index + 1}&include={resource}"}
+        self.reply({"_links": links, "_embedded": {resource: pages[index]}})
+
+    def reply(self, body):
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def strong(monkeypatch):
+    server = FakeStrong()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(api, "STRONG_API_BASE_URL", server.url)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def account(tmp_path, monkeypatch):
+    monkeypatch.setattr(accounts, "ACCOUNTS_DIR", str(tmp_path))
+    monkeypatch.setattr(accounts, "ACCOUNT_REQUEST_INTERVAL_SECONDS", 0)
+    monkeypatch.setattr(snapshot, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(api, "_tokens", {})
+    return Account("sync-test", "user@example.com", "secret")
+
+def read_ids(path):
+    """Returns the item ids of a snapshot by resource, whichever order the resources were written in."""
+    ids = {}
+    with open(path, "rb") as file:
+        for resource, item in iter_embedded(read_snapshot(file)):
+            ids.setdefault(resource, []).append(item["id"])
+    return ids
+
+def test_second_sync_resumes_each_resource_and_merges(strong, account):
+    strong.pages = {
+        "log": [[{"id": "w1"}, {"id": "w2"}], [{"id": "w3"}]],
+        "measurement": [[{"id": "squat"}]],
+        "measuredValue": [[{"id": "bw1"}]],
+    }
+    assert api.get_data(account)["status"] == "success"
+    with open(account.sync_state_path) as file:
+        assert json.load(file)["continuations"] == {"log": "1", "measurement": "", "measuredValue": ""}
+
+    # A workout lands on the last log page and a measurement is deleted upstream
+    strong.pages["log"][1].append({"id": "w4"})
+    strong.pages["measuredValue"] = [[]]
+    strong.requests.clear()
+    assert api.get_data(account)["status"] == "success"
+
+    # Only the last page of each resource is fetched again, single-page ones included
+    assert sorted(strong.requests) == [("log", "1"), ("measuredValue", ""), ("measurement", "")]
+    # Deleted items stay in the snapshot until a full sync
+    assert read_ids(account.json_path) == {
+        "log": ["w1", "w2", "w3", "w4"], "measurement": ["squat"], "measuredValue": ["bw1"],
+    }
+
+    strong.requests.clear()
+    assert api.get_data(account, full=True)["status"] == "success"
+    assert ("log", "") in strong.requests
+    assert read_ids(account.json_path) == {"log": ["w1", "w2", "w3", "w4"], "measurement": ["squat"]}
+
+def read_items(path, resource):
+    with open(path, "rb") as file:
+        return [item for key, item in iter_embedded(read_snapshot(file), [resource])]
+
+def test_edits_to_earlier_pages_wait_for_the_periodic_full_sync(strong, account, monkeypatch):
+    strong.pages = {
+        "log": [[{"id": "w1", "v": 1}, {"id": "w2", "v": 1}], [{"id": "w3", "v": 1}]],
+        "measurement": [[{"id": "squat"}]],
+        "measuredValue": [[{"id": "bw1"}]],
+    }
+    assert api.get_data(account)["status"] == "success"
+    strong.pages["log"][0][0] = {"id": "w1", "v": 2}
+    assert api.get_data(account)["status"] == "success"
+    assert read_items(account.json_path, "log")[0] == {"id": "w1", "v": 1}
+
+    # Once the last full sync is old enough, a refresh syncs everything again
+    monkeypatch.setattr(api, "FULL_SYNC_INTERVAL_SECONDS", 0)
+    strong.requests.clear()
+    assert api.get_data(account)["status"] == "success"
+    assert ("log", "") in strong.requests
+    assert read_items(account.json_path, "log") == [{"id": "w1", "v": 2}, {"id": "w2", "v": 1}, {"id": "w3", "v": 1}]
+
+def hold_snapshot_lock(account, locked, result=None):
+    """Plays a refresh of another process: holds the snapshot lock, saves result if given, then releases it."""
+    with file_lock(account.json_path):
+        locked.set()
+        time.sleep(0.2)
+        if result is not None:
+            with atomic_write(account.refresh_result_path) as file:
+                json.dump({"finished_at": time.time(), "result": result}, file)
+
+@pytest.mark.parametrize("result", [None, {"status": "success", "message": "fresh"}])
+def test_waiters_only_take_the_result_of_the_refresh_they_waited_for(account, result):
+    with atomic_write(account.refresh_result_path) as file:
+        json.dump({"finished_at": time.time() - 60, "result": {"status": "success", "message": "stale"}}, file)
+    locked = threading.Event()
+    leader = threading.Thread(target=hold_snapshot_lock, args=(account, locked, result))
+    leader.start()
+    assert locked.wait(5)
+    try:
+        waited = api.refresh_across_processes(account, False)
+    finally:
+        leader.join()
+    # A refresh that died before saving its result leaves the waiters an error, not the last run's result
+    assert waited == (result or {"status": "error", "message": "Concurrent refresh finished without a result."})
+
+def test_worker_forked_during_a_refresh_can_refresh_and_log_in(account, monkeypatch):
+    started, release = threading.Event(), threading.Event()
+
+    def slow_refresh(account, full, progress=None):
+        started.set()
+        release.wait()
+        return {"status": "success"}
+
+    monkeypatch.setattr(api, "refresh_across_processes", slow_refresh)
+    monkeypatch.setattr(api, "login", lambda account: {"access_token": "token", "user_id": "user", "expires_at": float("inf")})
+    thread = threading.Thread(target=api.refresh, kwargs={"account": account})
+    thread.start()
+    assert started.wait(5)
+    # A login of the same account in flight holds its token lock
+    with api._token_locks_lock:
+        login_lock = api._token_locks.setdefault(account.name, threading.Lock())
+    login_lock.acquire()
+    try:
+        pid = os.fork()
+        if pid == 0:
+            # The child is killed by the alarm if it hangs on what the parent's threads hold
+            signal.alarm(5)
+            release.set()
+            ok = api.refresh(account=account) == {"status": "success"} and api.get_auth(account)["access_token"] == "token"
+            os._exit(0 if ok else 1)
+        _, status = os.waitpid(pid, 0)
+    finally:
+        login_lock.release()
+        release.set()
+        thread.join()
+    assert os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
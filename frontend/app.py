@@ -49,25 +49,89 @@ def apply_custom_styles():
 # Apply styles when the dashboard is rendered
 apply_custom_styles()
 
-# @st.cache_data(ttl=600)  # Cache API response for 10 minutes
-def fetch_data():
-    """Fetches user workout data from Flask API."""
-    response = requests.get(f"{API_BASE_URL}/fetch_data")
-    
-    if response.status_code == 200:
-        return response.json()
-    else:
-        st.error("❌ Failed to fetch data.")
-        return None
+# Exercises charted on the dashboard (measurement ids from the Strong API)
+EXERCISES = {
+    "Bench Press": "ca9ee259-a69f-4839-bbf9-46ba8cf0d7d6",
+    "Deadlift": "b748103d-3014-4cae-a349-cec433528c3a",
+    "Squat": "b2f5a2de-c684-4e94-a6e5-581e0695fcac",
+    "Overhead Press": "4d563338-f2ed-430d-ae12-ec45482edf20",
+}
+
+@st.cache_data(ttl=60, show_spinner=False)  # Check for a new snapshot at most once a minute
+def fetch_version():
+    """Fetches the version of the backend's data snapshot."""
+    response = requests.get(f"{API_BASE_URL}/version", timeout=10)
+    response.raise_for_status()
+    return response.json()["version"]
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def fetch_json(path, version, **params):
+    """
+    Fetches an API endpoint. Results are cached per snapshot version, so
+    they are only requested again once the backend has new data.
+    """
+    response = requests.get(f"{API_BASE_URL}{path}", params=params, timeout=60)
+    response.raise_for_status()
+    return response.json()
+
+# 1RM formulas the backend precomputes session bests and PRs with
+E1RM_FORMULAS = {"Epley": "epley", "Brzycki": "brzycki", "Lander": "lander", "Lombardi": "lombardi", "O'Conner": "oconner"}
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def load_exercise_frame(exercise_id, formula, version):
+    """Loads the best set by estimated 1RM of every session of an exercise, in lbs, flagging all-time PRs."""
+    data = fetch_json(f"/exercises/{exercise_id}/series", version, agg="best_e1rm", formula=formula)
+    df = pd.DataFrame(data["series"], columns=["timestamp", "value", "weight", "reps", "is_pr"])
+    df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
+    df["weight"] = df["weight"].round(0)  # ✅ Round weight to whole numbers
+    df["1RM"] = df["value"].round(0)
+    return df.drop(columns="value").dropna()
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def load_bodyweight_frame(version):
+    """Loads the heaviest bodyweight entry of every timestamp, in lbs."""
+    df = pd.DataFrame(fetch_json("/bodyweight", version), columns=["timestamp", "weight"])
+    df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
+    df["weight"] = pd.to_numeric(df["weight"], errors="coerce").round(0)
+    return df.dropna().groupby("timestamp", as_index=False)["weight"].max()
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def load_weekly_volume_frame(version):
+    """Loads the weekly sets per muscle group."""
+    df = pd.DataFrame(fetch_json("/volume/weekly", version))
+    if not df.empty:
+        df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
+    return df
+
+# Charts are downsampled to this many points so long histories stay quick to render,
+# but a line never gets fewer than MIN_CHART_POINTS however many share the chart
+MAX_CHART_POINTS = 300
+MIN_CHART_POINTS = 10
+
+def downsample_frame(df, column, max_points=MAX_CHART_POINTS):
+    """
+    Caps a chronological frame at max_points rows with a min/max envelope:
+    each bucket of rows keeps only its lowest and highest value, so PR peaks
+    are never dropped.
+    """
+    if len(df) <= max_points:
+        return df
+    df = df.reset_index(drop=True)
+    buckets = df.index // (len(df) / max(1, (max_points - 2) // 2))
+    grouped = df.groupby(buckets)[column]
+    kept = {0, len(df) - 1} | set(grouped.idxmin()) | set(grouped.idxmax())
+    return df.loc[sorted(kept)]
 
 def show_dashboard():
     """Renders the Gym PR Dashboard."""
-    data = fetch_data()
-    if not data:
+    try:
+        version = fetch_version()
+    except requests.RequestException:
+        st.error("❌ Failed to fetch data.")
         return  # Stop execution if data fetch fails
 
     # Selection options
-    col1, col2 = st.columns([6, 1])
+    col1, col2, col3 = st.columns([5, 1, 1])
 
     with col1:
         st.subheader("📊 Select Time Frame:")
@@ -77,39 +141,29 @@ def show_dashboard():
         st.subheader("⚖️ Unit:")
         use_kg = st.toggle("Use KG", value=False)  # ✅ Default to Pounds (lbs)
 
+    with col3:
+        st.subheader("🧮 1RM:")
+        formula = E1RM_FORMULAS[st.selectbox("Formula", list(E1RM_FORMULAS), label_visibility="collapsed")]
+
     # Convert weight if needed
     unit_label = "KGs" if use_kg else "LBs"
     conversion_factor = 1 / 2.20462 if use_kg else 1  # ✅ Default: Pounds
 
-    def process_exercise_data(exercise_name, data_key, has_reps=True):
-        """Processes exercise data and plots the graph. Handles bodyweight separately."""
-        if data_key not in data or not data[data_key]:
+    def process_exercise_data(exercise_name, load_frame, has_reps=True):
+        """Plots the graph of an exercise from its cached frame. Handles bodyweight separately."""
+        try:
+            df = load_frame()
+        except requests.RequestException:
+            st.error(f"❌ Failed to fetch data for {exercise_name}.")
+            return
+        if df.empty:
             st.warning(f"No data available for {exercise_name}")
             return
 
-        df = pd.DataFrame(data[data_key])
-
-        # Ensure correct data types
-        df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
-        df["weight"] = pd.to_numeric(df["weight"], errors="coerce").round(0)  # ✅ Round weight to whole numbers
-
-        # Drop NaN values
-        df = df.dropna()
-
-        if has_reps:
-            df["reps"] = pd.to_numeric(df["reps"], errors="coerce")
-            df = df[df["reps"] > 0]
-            df["1RM"] = (df["weight"] * (1 + df["reps"] / 30)).round(0)
-
-            # Always use the best set by 1RM
-            best_1rm_sets = df.loc[df.groupby("timestamp")["1RM"].idxmax()]
-            selected_data = best_1rm_sets.copy()
-
-            # Plot actual weight or 1RM estimate based on chart type
-            y_column = "1RM"
-        else:
-            selected_data = df.groupby("timestamp", as_index=False)["weight"].max()
-            y_column = "weight"
+        # The cached frame is shared between reruns, so work on a copy
+        selected_data = df.copy()
+        # Plot actual weight or 1RM estimate based on chart type
+        y_column = "1RM" if has_reps else "weight"
 
         # Apply conversion
         selected_data[y_column] *= conversion_factor
@@ -124,6 +178,7 @@ def show_dashboard():
             start_date = selected_data["timestamp"].min()
 
         selected_data = selected_data[selected_data["timestamp"] >= start_date]
+        selected_data = downsample_frame(selected_data, y_column)
 
         chart_title = f"{exercise_name} - Progression ({unit_label})"
 
@@ -145,6 +200,7 @@ def show_dashboard():
         if has_reps:
             tooltip_list.append(alt.Tooltip("reps", title="🔄 Reps"))
             tooltip_list.append(alt.Tooltip("1RM", title="📈 1RM Estimate", format=".1f"))
+            tooltip_list.append(alt.Tooltip("is_pr", title="🏆 All-Time PR"))
 
         # ✅ Create Altair Chart (Smooth Line + Stylish Points)
         chart = (
@@ -175,14 +231,17 @@ def show_dashboard():
         st.altair_chart(final_chart, use_container_width=True)
 
         
-    def plot_weekly_volume(weekly_volume_key):
-        if weekly_volume_key not in data or not data[weekly_volume_key]:
+    def plot_weekly_volume():
+        try:
+            df = load_weekly_volume_frame(version)
+        except requests.RequestException:
+            st.error("❌ Failed to fetch weekly volume data.")
+            return
+        if df.empty:
             st.warning("No weekly volume data available.")
             return
 
-        df = pd.DataFrame(data[weekly_volume_key])
-
-        df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
+        df = df.copy()
 
         # Apply time range filters
         if time_range != "All Time":
@@ -211,6 +270,11 @@ def show_dashboard():
             return
 
         df = df[df["Muscle Group"].isin(selected_muscles)]
+        # Every muscle group gets its own line, so each of them shares the point budget
+        df = pd.concat(
+            downsample_frame(group, "Sets", max(MIN_CHART_POINTS, MAX_CHART_POINTS // len(selected_muscles)))
+            for _, group in df.groupby("Muscle Group")
+        )
 
         # ✅ Create Altair Chart with Smoothed Curves & Improved Readability
         chart = (
@@ -255,11 +319,25 @@ def show_dashboard():
 
 
     # Render charts for all exercises
-    process_exercise_data("Bench Press", "bench_press")
-    process_exercise_data("Deadlift", "deadlift")
-    process_exercise_data("Squat", "squat")
-    process_exercise_data("Overhead Press", "overhead_press")
-    plot_weekly_volume("weekly_volume")
-    process_exercise_data("Bodyweight", "bodyweight", has_reps= False)
+    for exercise_name, exercise_id in EXERCISES.items():
+        process_exercise_data(exercise_name, lambda exercise_id=exercise_id: load_exercise_frame(exercise_id, formula, version))
+    plot_weekly_volume()
+    process_exercise_data("Bodyweight", lambda: load_bodyweight_frame(version), has_reps= False)
+
+    # Any other exercise of the catalogue is charted on demand
+    try:
+        catalogue = fetch_json("/exercises", version)
+    except requests.RequestException:
+        st.error("❌ Failed to fetch the exercise catalogue.")
+        return
+    others = {
+        exercise["name"]: exercise["id"] for exercise in catalogue
+        if exercise["sets"] and exercise["id"] not in EXERCISES.values()
+    }
+    if others:
+        st.subheader("🔍 Other Exercises")
+        exercise_name = st.selectbox("Select an exercise:", list(others), index=None)
+        if exercise_name:
+            process_exercise_data(exercise_name, lambda: load_exercise_frame(others[exercise_name], formula, version))
 
 show_dashboard()